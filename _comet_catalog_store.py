@@ -0,0 +1,100 @@
+from skyfield.api import Loader
+from skyfield.data import mpc
+import numpy as np
+import pandas as pd
+import hashlib
+import os
+import time
+
+# =================ตั้งค่าแคตตาล็อกดาวหาง=================
+# เก็บไฟล์ CometEls.txt ล่าสุดที่ดาวน์โหลด และสำเนาที่ parse แล้ว (CometEls.npz) ไว้ในโฟลเดอร์นี้
+# สำเนาของไฟล์ที่ระบุเอง (local_path) ก็เก็บที่นี่ ชื่อ CometEls-<hash ของ path>.npz ไม่เขียนไว้ข้างไฟล์ต้นฉบับ
+CATALOG_DIR = '.'
+COMET_FILENAME = 'CometEls.txt'
+PARSED_FILENAME = 'CometEls.npz'
+
+# ดาวน์โหลดใหม่เมื่อไฟล์เดิมเก่ากว่านี้ (ชั่วโมง)
+CATALOG_MAX_AGE_HOURS = 24.0
+# ====================================================
+
+def _file_age_hours(path):
+    return (time.time() - os.path.getmtime(path)) / 3600.0
+
+def _source_signature(path):
+    stat = os.stat(path)
+    return np.array([stat.st_size, stat.st_mtime])
+
+def parsed_path_for(source_path, directory=CATALOG_DIR):
+    # ไฟล์สำเนาที่ parse แล้วของ source_path (ขนาด/เวลาแก้ไขของต้นฉบับเก็บไว้ในไฟล์ ตรวจตอนอ่าน)
+    if os.path.abspath(source_path) == os.path.abspath(os.path.join(directory, COMET_FILENAME)):
+        return os.path.join(directory, PARSED_FILENAME)
+    digest = hashlib.sha1(os.path.realpath(source_path).encode('utf-8')).hexdigest()[:12]
+    name, ext = os.path.splitext(PARSED_FILENAME)
+    return os.path.join(directory, f"{name}-{digest}{ext}")
+
+def save_parsed(comets, path, source_path):
+    # บันทึก dataframe แบบ columnar (1 array ต่อคอลัมน์) พร้อมขนาด/เวลาของไฟล์ต้นฉบับ
+    columns = {}
+    for name in comets.columns:
+        series = comets[name]
+        if pd.api.types.is_numeric_dtype(series):
+            columns[name] = series.to_numpy()
+        else:
+            columns[name] = series.fillna('').to_numpy(dtype=str)
+    tmp = path + '.tmp.npz'
+    np.savez(tmp, __source__=_source_signature(source_path), **columns)
+    os.replace(tmp, path)
+
+def load_parsed(path, source_path):
+    # อ่านสำเนาที่ parse แล้ว ถ้าไม่มีหรือไม่ตรงกับไฟล์ต้นฉบับปัจจุบันคืน None
+    try:
+        with np.load(path, allow_pickle=False) as data:
+            if not np.array_equal(data['__source__'], _source_signature(source_path)):
+                return None
+            columns = {name: data[name] for name in data.files if name != '__source__'}
+    except (FileNotFoundError, KeyError, ValueError, OSError):
+        return None
+
+    comets = pd.DataFrame(columns)
+    for name in comets.columns:
+        if comets[name].dtype.kind == 'U':
+            comets[name] = comets[name].astype(object)
+    return comets
+
+def load_comet_catalog(max_age_hours=CATALOG_MAX_AGE_HOURS, force=False, offline=False,
+                       local_path=None, directory=CATALOG_DIR, verbose=True):
+    # คืน dataframe ของแคตตาล็อกดาวหาง MPC
+    # - local_path: ใช้ไฟล์ CometEls.txt ที่มีอยู่แล้ว ไม่ต่อเน็ต
+    # - offline: ใช้ไฟล์ใน directory ที่ดาวน์โหลดไว้ล่าสุด ไม่ว่าจะเก่าแค่ไหน
+    # - ไม่อย่างนั้นดาวน์โหลดใหม่เมื่อ force หรือไฟล์เก่ากว่า max_age_hours
+    if local_path is not None:
+        source_path = local_path
+    else:
+        source_path = os.path.join(directory, COMET_FILENAME)
+        exists = os.path.exists(source_path)
+        stale = not exists or _file_age_hours(source_path) > max_age_hours
+        if not offline and (force or stale):
+            if verbose:
+                print("📥 กำลังดาวน์โหลดข้อมูลล่าสุดจาก MPC...")
+                print("   (ขั้นตอนนี้ต้องต่อเน็ต และอาจใช้เวลาสักครู่)")
+            try:
+                Loader(directory, verbose=verbose).download(mpc.COMET_URL, filename=COMET_FILENAME)
+            except Exception as e:
+                if not exists:
+                    raise
+                print(f"⚠️ ดาวน์โหลดไม่สำเร็จ ({e}) ใช้ข้อมูลเดิมที่เก็บไว้แทน")
+        elif verbose:
+            print(f"📂 ใช้ข้อมูล MPC ที่เก็บไว้ ({_file_age_hours(source_path):.1f} ชั่วโมงที่แล้ว)")
+
+    parsed_path = parsed_path_for(source_path, directory)
+    comets = load_parsed(parsed_path, source_path)
+    if comets is None:
+        with open(source_path, 'rb') as f:
+            comets = mpc.load_comets_dataframe(f)
+        if 'designation' not in comets.columns:
+            comets = comets.reset_index()
+        try:
+            save_parsed(comets, parsed_path, source_path)
+        except OSError as e:
+            print(f"⚠️ บันทึกสำเนาที่ parse แล้วไม่สำเร็จ: {e}")
+    return comets
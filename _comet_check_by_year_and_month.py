@@ -1,14 +1,27 @@
-from skyfield.api import load, Topos
+from skyfield.api import Topos
 from skyfield.data import mpc
 from skyfield.constants import GM_SUN_Pitjeva_2005_km3_s2
+from skyfield.nutationlib import iau2000b_radians
+from skyfield.jpllib import SpiceKernel
+from concurrent.futures import ProcessPoolExecutor
 import pandas as pd
 import math
 import json
 import os
+import calendar
 from datetime import datetime, timedelta
 import pytz
 import numpy as np
 
+from _comet_orbit_engine import (
+    orbital_elements, screen_magnitudes, closest_approach, comet_altaz, nightly_windows,
+)
+from _comet_catalog_store import load_comet_catalog
+from _comet_results_store import open_store, elements_hashes, search_params, load_results, save_results, prune_store
+from _milkyway_state_cache import ephemeris_id
+from _stargazing_profile import stage
+from _stargazing_ephemeris import ephemeris, timescale
+
 # ================= ⚙️ ตั้งค่าการค้นหา =================
 SEARCH_YEAR = 2026          # ปีที่ต้องการค้นหา
 START_MONTH = 1             # เดือนเริ่มต้น (เช่น ม.ค.)
@@ -21,6 +34,47 @@ THAI_TZ = pytz.timezone('Asia/Bangkok')
 # มุมสูงขั้นต่ำของดาวหางที่จะเริ่มถ่าย (องศา)
 MIN_MW_ALTITUDE = 15.0 
 
+# วิธี Screening ความสว่าง
+# 'vectorized' = คำนวณวงโคจรทุกดวงทุกเดือนพร้อมกันด้วย NumPy (ไม่กี่วินาทีทั้งปี)
+# 'loop'       = สร้าง comet_orbit และ observe ทีละดวงแบบเดิม
+SCREENING_ENGINE = 'vectorized'
+
+# วิธีตรวจมุมมองของดวงที่ผ่าน Screening
+# 'nightly'  = ทุกคืนของเดือน (18:00-06:00 ทุก NIGHT_STEP_MINUTES นาที) ทุกดวงพร้อมกัน
+#              ได้ช่วงเวลาขึ้นพ้นเกณฑ์-ตก และมุมสูงสุดของแต่ละคืน
+# 'instants' = เช็คแค่ 2 เวลาในวันที่ 15 (20:00 และ 04:00 น.) แบบเดิม
+DETAILED_CHECK = 'nightly'
+NIGHT_STEP_MINUTES = 10
+
+# วิธีหาวันที่ใกล้โลกที่สุด (Perigee)
+# 'batched' = คำนวณทุกดวงที่ถ่ายได้พร้อมกัน แล้วปรับจุดต่ำสุดให้ละเอียดระดับนาที
+# 'daily'   = สุ่มตำแหน่งรายวันทีละดวงแบบเดิม (ละเอียดระดับวัน)
+CLOSEST_APPROACH_ENGINE = 'batched'
+# ค้นหาเลยขอบปีออกไปกี่วัน (0 = เฉพาะในปี SEARCH_YEAR)
+CLOSEST_APPROACH_MARGIN_DAYS = 0
+
+# --- ตั้งค่าการประมวลผลหลาย process ---
+# แบ่งงานเป็น (เดือน x กลุ่มละ COMETS_PER_TASK ดวง) กระจายไป WORKERS process (None = จำนวน core, 1 = ไม่แบ่ง)
+# ผลลัพธ์เหมือนแบบ process เดียวทุกประการ
+WORKERS = None
+COMETS_PER_TASK = 25
+# จำนวนดวงที่ผ่าน Screening รวมทุกเดือนขั้นต่ำที่จะเริ่มใช้ process pool (งานน้อยกว่านี้เริ่ม pool ไม่คุ้ม)
+PARALLEL_MIN_CANDIDATES = 50
+
+# --- ตั้งค่าข้อมูล MPC (CometEls.txt) ---
+CATALOG_MAX_AGE_HOURS = 24      # ดาวน์โหลดใหม่เมื่อไฟล์ที่เก็บไว้เก่ากว่านี้ (ชั่วโมง)
+CATALOG_FORCE_RELOAD = False    # True = ดาวน์โหลดใหม่ทุกครั้งแบบเดิม
+CATALOG_OFFLINE = False         # True = ไม่ต่อเน็ต ใช้ไฟล์ที่ดาวน์โหลดไว้ล่าสุด
+CATALOG_LOCAL_FILE = None       # ระบุ path ของ CometEls.txt ที่มีอยู่แล้ว (ทำงาน offline ทั้งหมด)
+
+# --- ตั้งค่าการเก็บผลรายดวง ---
+# เก็บผลของแต่ละดวงลง SQLite (_comet_results_store.py) รันครั้งถัดไปคำนวณใหม่เฉพาะดวงที่เพิ่มมาหรือวงโคจรเปลี่ยน
+# (None = คำนวณใหม่ทุกดวงทุกครั้ง)
+RESULTS_STORE_FILENAME = 'comet_results.sqlite'
+# ลบผลของดวงที่ไม่มีในแคตตาล็อกปัจจุบันแล้ว ที่คำนวณไว้นานกว่ากี่วัน (None = ไม่ลบ ผลเก่ายังอยู่ในไฟล์)
+# ไม่ลบเป็นค่าเริ่มต้น เพราะรันกับ CATALOG_LOCAL_FILE ที่เป็นแคตตาล็อกย่อยจะทำให้ผลของแคตตาล็อกจริงหายไป
+PRUNE_RESULTS_AFTER_DAYS = None
+
 # --- ตั้งค่า Output ---
 SAVE_JSON = True
 JSON_FILENAME = f"comets_{SEARCH_YEAR}_month_{START_MONTH:02d}-{END_MONTH:02d}.json"
@@ -48,105 +102,378 @@ def get_closest_approach_in_year(comet, sun, earth, ts, year):
     best_time_thai = times[min_idx].utc_datetime().replace(tzinfo=pytz.utc).astimezone(THAI_TZ)
     return best_time_thai, distances[min_idx]
 
-def find_comets_multi_month():
-    print(f"🚀 เริ่มภารกิจค้นหาดาวหาง ปี {SEARCH_YEAR} (เดือน {START_MONTH} - {END_MONTH})")
-    
-    # 1. โหลดข้อมูลครั้งเดียวใช้ยาวๆ
-    url = 'https://www.minorplanetcenter.net/iau/MPCORB/CometEls.txt'
-    print("📥 กำลังดาวน์โหลดข้อมูลล่าสุดจาก MPC (Force Reload)...")
-    print("   (ขั้นตอนนี้ต้องต่อเน็ต และอาจใช้เวลาสักครู่)")
-    with load.open(url, reload=True) as f:
-        comets = mpc.load_comets_dataframe(f)
-    if 'designation' not in comets.columns:
-        comets = comets.reset_index()
-
-    ts = load.timescale()
-    sun = load('de421.bsp')['sun']
-    earth = load('de421.bsp')['earth']
-    location = earth + Topos(latitude_degrees=LATITUDE, longitude_degrees=LONGITUDE)
-
-    all_results = [] # เก็บผลรวมทุกเดือน
+def fill_closest_approaches(results, rows, sun, earth, ts, year, pool=None):
+    # คำนวณ Perigee ของทุกดวงที่ถ่ายได้ในครั้งเดียว (ดวงเดียวกันที่เจอหลายเดือนคำนวณครั้งเดียว)
+    # results = [(ตำแหน่งใน comets, ผล), ...] และ rows = [(ตำแหน่ง, แถว), ...] ใช้ตำแหน่งเป็น key ไม่ใช่ชื่อ
+    # (CometEls.txt มีบางดวงที่ชื่อซ้ำแต่วงโคจรต่างกัน)
+    # ถ้าส่ง pool มา จะแบ่งเป็นกลุ่มละ COMETS_PER_TASK ดวงไปคำนวณใน worker แล้วต่อผลตามลำดับเดิม
+    unique_rows = {}
+    for position, row in rows:
+        unique_rows.setdefault(position, row)
+    if not unique_rows:
+        return
+
+    frame = pd.DataFrame(list(unique_rows.values()))
+    if pool is None:
+        tt, distances = closest_approach(orbital_elements(frame, ts), sun, earth, ts, year,
+                                         margin_days=CLOSEST_APPROACH_MARGIN_DAYS)
+    else:
+        chunks = [frame.iloc[i:i + COMETS_PER_TASK] for i in range(0, len(frame), COMETS_PER_TASK)]
+        parts = list(pool.map(_closest_job, chunks, [year] * len(chunks)))
+        tt = np.concatenate([part[0] for part in parts])
+        distances = np.concatenate([part[1] for part in parts])
+    times = ts.tt_jd(tt).utc_datetime()
+
+    approaches = {}
+    for position, dt, dist in zip(unique_rows, times, distances):
+        dt_thai = dt.astimezone(THAI_TZ)
+        approaches[position] = {
+            "date": dt_thai.strftime("%Y-%m-%d"),
+            "date_local": dt_thai.strftime("%Y-%m-%d %H:%M:%S"),
+            "distance_au": round(float(dist), 4)
+        }
+    for position, res in results:
+        res["closest_approach"] = approaches[position]
+
+def check_instants(candidates, sun, location, ts, year, month, min_altitude=MIN_MW_ALTITUDE):
+    # Detailed Check (หัวค่ำ/เช้ามืด) ทีละดวง ณ 2 เวลาของวันที่ 15
+    # candidates = [(แถว, ความสว่าง, ตำแหน่งใน comets), ...] คืน [(แถว, ความสว่าง, ตำแหน่ง, รายละเอียด), ...]
+    check_times = [
+        (ts.utc(year, month, 15, 13, 0, 0), "หัวค่ำ (20:00 น.)"),
+        (ts.utc(year, month, 15, 21, 0, 0), "เช้ามืด (04:00 น.)")
+    ]
+
+    checked = []
+    for row, est_mag, position in candidates:
+        comet = sun + mpc.comet_orbit(row, ts, GM_SUN_Pitjeva_2005_km3_s2)
+        visible = False
+        best_alt = -90
+        best_az = 0
+        visible_period = ""
+        check_time_str = ""
+        
+        for t, period_name in check_times:
+            sun_alt = location.at(t).observe(sun).apparent().altaz()[0].degrees
+            if sun_alt > -12: continue 
+            
+            alt, az, _ = location.at(t).observe(comet).apparent().altaz()
+            
+            if alt.degrees > min_altitude: 
+                visible = True
+                if alt.degrees > best_alt: 
+                    best_alt = alt.degrees
+                    best_az = az.degrees
+                    visible_period = period_name
+                    dt_thai = t.utc_datetime().replace(tzinfo=pytz.utc).astimezone(THAI_TZ)
+                    check_time_str = dt_thai.strftime("%Y-%m-%d %H:%M:%S")
+        
+        if visible:
+            checked.append((row, est_mag, position, {
+                "altitude_max": round(best_alt, 2),
+                "azimuth": round(best_az, 2),
+                "visibility_period": visible_period,
+                "check_date_local": check_time_str,
+            }))
+    return checked
+
+def month_night_grid(ts, year, month):
+    # ตารางเวลา 18:00-06:00 (เวลาไทย) ทุกคืนของเดือน: เวลาเริ่มคืนแรก, นาทีนับจากเวลาเริ่ม (คืน x step), Time
+    nights = calendar.monthrange(year, month)[1]
+    start = THAI_TZ.localize(datetime(year, month, 1, 18, 0))
+    start_utc = start.astimezone(pytz.utc)
+    steps = np.arange(0, 12 * 60 + 1, NIGHT_STEP_MINUTES)
+    minutes = np.arange(nights)[:, None] * 1440 + steps[None, :]
+    t = ts.utc(start_utc.year, start_utc.month, start_utc.day, start_utc.hour, minutes.ravel())
+    # ใช้ nutation แบบย่อ IAU2000B (ต่างจากแบบเต็มไม่ถึง 1 มิลลิอาร์ควินาที แต่เร็วกว่ามาก)
+    t._nutation_angles_radians = iau2000b_radians(t)
+    return start, minutes, t
+
+def check_nightly(candidates, sun, earth, topos, ts, year, month, min_altitude=MIN_MW_ALTITUDE):
+    # Detailed Check ทุกคืนของเดือน: มุมสูงของทุกดวง ณ ทุกเวลาพร้อมกัน (ดวง x เวลา)
+    # แล้วสรุปรายคืนเป็นช่วงที่ดาวหางสูงเกิน min_altitude ขณะฟ้ามืด (ดวงอาทิตย์ต่ำกว่า -12°)
+    start, minutes, t = month_night_grid(ts, year, month)
+    sun_alt = (earth + topos).at(t).observe(sun).apparent().altaz()[0].degrees.reshape(minutes.shape)
+
+    elements = orbital_elements(pd.DataFrame([row for row, _, _ in candidates]), ts)
+    alt, az = comet_altaz(elements, sun, earth, topos, t)
+    alt = alt.reshape((len(candidates),) + minutes.shape)
+    az = az.reshape(alt.shape)
+    has_window, first, last, peak = nightly_windows(alt, sun_alt, min_altitude)
+
+    def local_time(night, step):
+        return start + timedelta(minutes=int(minutes[night, step]))
+
+    checked = []
+    for i, (row, est_mag, position) in enumerate(candidates):
+        windows = []
+        for night in np.flatnonzero(has_window[i]):
+            peak_time = local_time(night, peak[i, night])
+            windows.append({
+                "date": (start + timedelta(days=int(night))).strftime("%Y-%m-%d"),
+                "start": local_time(night, first[i, night]).strftime("%H:%M"),
+                "peak": peak_time.strftime("%H:%M"),
+                "end": local_time(night, last[i, night]).strftime("%H:%M"),
+                "altitude_max": round(float(alt[i, night, peak[i, night]]), 2),
+                "azimuth": round(float(az[i, night, peak[i, night]]), 2),
+            })
+        if not windows:
+            continue
+
+        # สรุปของทั้งเดือนจากคืนที่ดาวหางขึ้นสูงที่สุด
+        best_index = int(np.argmax([w["altitude_max"] for w in windows]))
+        best = windows[best_index]
+        best_night = np.flatnonzero(has_window[i])[best_index]
+        peak_time = local_time(best_night, peak[i, best_night])
+        period_name = "หัวค่ำ" if peak_time.hour >= 12 else "เช้ามืด"
+        checked.append((row, est_mag, position, {
+            "altitude_max": best["altitude_max"],
+            "azimuth": best["azimuth"],
+            "visibility_period": f"{period_name} ({peak_time.strftime('%H:%M')} น.)",
+            "check_date_local": peak_time.strftime("%Y-%m-%d %H:%M:%S"),
+            "visible_nights": len(windows),
+            "nightly_windows": windows,
+        }))
+    return checked
+
+def run_detailed_check(candidates, sun, earth, topos, ts, year, month, min_altitude):
+    with stage('detailed_check'):
+        if DETAILED_CHECK == 'nightly':
+            return check_nightly(candidates, sun, earth, topos, ts, year, month, min_altitude)
+        return check_instants(candidates, sun, earth + topos, ts, year, month, min_altitude)
+
+# ข้อมูลของแต่ละ worker process: แคตตาล็อก ephemeris และตั้งค่า ส่งมาครั้งเดียวตอนเริ่ม worker
+_worker = {}
+
+def _init_worker(comets, ephemeris_path, latitude, longitude, settings):
+    # ตั้งค่าที่แก้ใน process หลัก (เช่น DETAILED_CHECK) ไม่ติดมากับ worker ที่เริ่มด้วย spawn จึงส่งมาเอง
+    globals().update(settings)
+    kernel = SpiceKernel(ephemeris_path)
+    _worker.update(comets=comets, sun=kernel['sun'], earth=kernel['earth'], ts=timescale(),
+                   topos=Topos(latitude_degrees=latitude, longitude_degrees=longitude))
+
+def _check_job(year, month, positions, magnitudes, min_altitude):
+    # Detailed Check ของดาวหางกลุ่มหนึ่งในเดือนเดียว คืน (ตำแหน่งใน comets, ความสว่าง, รายละเอียด)
+    candidates = [(_worker['comets'].iloc[i], mag, i) for i, mag in zip(positions, magnitudes)]
+    checked = run_detailed_check(candidates, _worker['sun'], _worker['earth'], _worker['topos'],
+                                 _worker['ts'], year, month, min_altitude)
+    return [(position, est_mag, details) for _, est_mag, position, details in checked]
+
+def _closest_job(frame, year):
+    elements = orbital_elements(frame, _worker['ts'])
+    return closest_approach(elements, _worker['sun'], _worker['earth'], _worker['ts'], year,
+                            margin_days=CLOSEST_APPROACH_MARGIN_DAYS)
+
+def search_comets(comets, sun, earth, ts, year=SEARCH_YEAR, start_month=START_MONTH, end_month=END_MONTH,
+                  max_magnitude=MAX_MAGNITUDE, latitude=LATITUDE, longitude=LONGITUDE,
+                  min_altitude=MIN_MW_ALTITUDE, verbose=True, workers=1, ephemeris_path=None, return_positions=False):
+    # ค้นหาดาวหางที่ถ่ายได้จากแคตตาล็อกและ ephemeris ที่โหลดไว้แล้ว คืนรายการเรียงตามเดือน แล้วตามความสว่าง
+    # return_positions=True คืน [(ตำแหน่งใน comets, ผล), ...] แทน (ชื่อซ้ำกันได้ ใช้ตำแหน่งจับคู่กับแถวในแคตตาล็อก)
+    # workers > 1 (None = จำนวน core) และมี ephemeris_path (ไฟล์ .bsp ของ sun/earth) จะกระจาย Detailed Check และ Perigee ไปหลาย process
+    log = print if verbose else (lambda *args, **kwargs: None)
+    topos = Topos(latitude_degrees=latitude, longitude_degrees=longitude)
+
+    all_results = [] # เก็บผลรวมทุกเดือน (ตำแหน่งใน comets, ผล)
+    visible_rows = [] # ดวงที่ถ่ายได้ (ตำแหน่ง, แถว) สำหรับคำนวณ Perigee แบบ batched ตอนท้าย
+
+    # Screening ทุกเดือนในครั้งเดียว: ความสว่างของทุกดวง ณ วันที่ 15 ของแต่ละเดือน (ดวง x เดือน)
+    if SCREENING_ENGINE == 'vectorized':
+        with stage('comet_screening'):
+            elements = orbital_elements(comets, ts)
+            months = list(range(start_month, end_month + 1))
+            screen_mags = screen_magnitudes(elements, sun, earth, ts.utc(year, months, 15))
+        total_candidates = int((screen_mags <= max_magnitude).sum())
+    else:
+        total_candidates = None
+
+    workers = workers or os.cpu_count() or 1
+    parallel = workers > 1 and ephemeris_path is not None and \
+        (total_candidates is None or total_candidates >= PARALLEL_MIN_CANDIDATES)
+    units = [] # งานสำหรับ process pool (เดือน, ตำแหน่งใน comets, ความสว่าง) ตามลำดับเดือน
+
+    def collect(current_month, checked):
+        monthly_found = 0
+        for row, est_mag, position, details in checked:
+            comet_info = {
+                "month": current_month, # ระบุเดือนที่เจอ
+                "year": year,
+                "name": row['designation'],
+                "magnitude": round(est_mag, 2),
+                **details,
+                "closest_approach": None
+            }
+            if CLOSEST_APPROACH_ENGINE == 'daily':
+                with stage('closest_approach'):
+                    comet = sun + mpc.comet_orbit(row, ts, GM_SUN_Pitjeva_2005_km3_s2)
+                    closest_date, closest_dist = get_closest_approach_in_year(comet, sun, earth, ts, year)
+                comet_info["closest_approach"] = {
+                    "date": closest_date.strftime("%Y-%m-%d"),
+                    "distance_au": round(closest_dist, 4)
+                }
+            else:
+                visible_rows.append((position, row))
+            all_results.append((position, comet_info))
+            monthly_found += 1
+        return monthly_found
 
     # 2. เริ่ม Loop ทีละเดือน
-    for current_month in range(START_MONTH, END_MONTH + 1):
-        print(f"\n🗓️  กำลังตรวจสอบเดือน {current_month}/{SEARCH_YEAR}...")
+    for current_month in range(start_month, end_month + 1):
+        log(f"\n🗓️  กำลังตรวจสอบเดือน {current_month}/{year}...")
         
         # Screening วันที่ 15 ของเดือน
         try:
-            mid_month_time = ts.utc(SEARCH_YEAR, current_month, 15)
+            mid_month_time = ts.utc(year, current_month, 15)
         except ValueError:
             continue # ข้ามถ้าวันที่ผิดพลาด
 
-        candidates = []
-        for i, (index, row) in enumerate(comets.iterrows()):
-            try:
-                comet_orbit = sun + mpc.comet_orbit(row, ts, GM_SUN_Pitjeva_2005_km3_s2)
-                pos_sun = sun.at(mid_month_time).observe(comet_orbit)
-                pos_earth = earth.at(mid_month_time).observe(comet_orbit)
-                mag = calculate_comet_magnitude(row, pos_earth.distance().au, pos_sun.distance().au)
-                
-                if mag <= MAX_MAGNITUDE:
-                    candidates.append((row, mag))
-            except:
-                continue
+        candidates = [] # (แถว, ความสว่าง, ตำแหน่งใน comets) ตำแหน่งส่งให้ worker แทนข้อมูลทั้งแถว
+        if SCREENING_ENGINE == 'vectorized':
+            month_mags = screen_mags[:, current_month - start_month]
+            for i in np.flatnonzero(month_mags <= max_magnitude):
+                candidates.append((comets.iloc[i], float(month_mags[i]), int(i)))
+        else:
+            with stage('comet_screening'):
+                for i, (index, row) in enumerate(comets.iterrows()):
+                    try:
+                        comet_orbit = sun + mpc.comet_orbit(row, ts, GM_SUN_Pitjeva_2005_km3_s2)
+                        pos_sun = sun.at(mid_month_time).observe(comet_orbit)
+                        pos_earth = earth.at(mid_month_time).observe(comet_orbit)
+                        mag = calculate_comet_magnitude(row, pos_earth.distance().au, pos_sun.distance().au)
+                        
+                        if mag <= max_magnitude:
+                            candidates.append((row, mag, i))
+                    except:
+                        continue
         
         if not candidates:
-            print(f"   - ไม่พบดาวหางเข้าเกณฑ์ในเดือนนี้")
+            log(f"   - ไม่พบดาวหางเข้าเกณฑ์ในเดือนนี้")
             continue
 
-        print(f"   - พบ {len(candidates)} ดวงที่มีลุ้น ตรวจสอบมุมมอง...")
+        log(f"   - พบ {len(candidates)} ดวงที่มีลุ้น ตรวจสอบมุมมอง...")
 
-        # Detailed Check (หัวค่ำ/เช้ามืด)
-        check_times = [
-            (ts.utc(SEARCH_YEAR, current_month, 15, 13, 0, 0), "หัวค่ำ (20:00 น.)"),
-            (ts.utc(SEARCH_YEAR, current_month, 15, 21, 0, 0), "เช้ามืด (04:00 น.)")
-        ]
+        if parallel:
+            units.append((current_month, [i for _, _, i in candidates], [mag for _, mag, _ in candidates]))
+            continue
 
-        monthly_found = 0
-        for row, est_mag in candidates:
-            comet = sun + mpc.comet_orbit(row, ts, GM_SUN_Pitjeva_2005_km3_s2)
-            visible = False
-            best_alt = -90
-            best_az = 0
-            visible_period = ""
-            check_time_str = ""
-            
-            for t, period_name in check_times:
-                sun_alt = location.at(t).observe(sun).apparent().altaz()[0].degrees
-                if sun_alt > -12: continue 
-                
-                alt, az, _ = location.at(t).observe(comet).apparent().altaz()
-                
-                if alt.degrees > MIN_MW_ALTITUDE: 
-                    visible = True
-                    if alt.degrees > best_alt: 
-                        best_alt = alt.degrees
-                        best_az = az.degrees
-                        visible_period = period_name
-                        dt_thai = t.utc_datetime().replace(tzinfo=pytz.utc).astimezone(THAI_TZ)
-                        check_time_str = dt_thai.strftime("%Y-%m-%d %H:%M:%S")
-            
-            if visible:
-                closest_date, closest_dist = get_closest_approach_in_year(comet, sun, earth, ts, SEARCH_YEAR)
-                
-                comet_info = {
-                    "month": current_month, # ระบุเดือนที่เจอ
-                    "year": SEARCH_YEAR,
-                    "name": row['designation'],
-                    "magnitude": round(est_mag, 2),
-                    "altitude_max": round(best_alt, 2),
-                    "azimuth": round(best_az, 2),
-                    "visibility_period": visible_period,
-                    "check_date_local": check_time_str,
-                    "closest_approach": {
-                        "date": closest_date.strftime("%Y-%m-%d"),
-                        "distance_au": round(closest_dist, 4)
-                    }
-                }
-                all_results.append(comet_info)
-                monthly_found += 1
-        
-        print(f"   ✅ ยืนยันถ่ายได้: {monthly_found} ดวง")
+        checked = run_detailed_check(candidates, sun, earth, topos, ts, year, current_month, min_altitude)
+        monthly_found = collect(current_month, checked)
+        log(f"   ✅ ยืนยันถ่ายได้: {monthly_found} ดวง")
+
+    if units:
+        # ส่งงาน (เดือน x กลุ่มละ COMETS_PER_TASK ดวง) ทั้งหมดเข้า pool แล้วรวมผลตามลำดับเดือน/ลำดับกลุ่ม
+        # ผลจึงเรียงเหมือนแบบ process เดียว ไม่ขึ้นกับว่างานไหนเสร็จก่อน
+        settings = {name: globals()[name] for name in ('DETAILED_CHECK', 'NIGHT_STEP_MINUTES',
+                                                        'CLOSEST_APPROACH_MARGIN_DAYS', 'COMETS_PER_TASK')}
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                                 initargs=(comets, ephemeris_path, latitude, longitude, settings)) as pool:
+            pending = [(current_month, [
+                pool.submit(_check_job, year, current_month, positions[i:i + COMETS_PER_TASK],
+                            magnitudes[i:i + COMETS_PER_TASK], min_altitude)
+                for i in range(0, len(positions), COMETS_PER_TASK)])
+                for current_month, positions, magnitudes in units]
+
+            log("")
+            for current_month, futures in pending:
+                with stage('detailed_check'):
+                    checked = [(comets.iloc[i], est_mag, i, details) for future in futures
+                               for i, est_mag, details in future.result()]
+                monthly_found = collect(current_month, checked)
+                log(f"   ✅ เดือน {current_month}/{year} ยืนยันถ่ายได้: {monthly_found} ดวง")
+
+            if CLOSEST_APPROACH_ENGINE != 'daily':
+                with stage('closest_approach'):
+                    fill_closest_approaches(all_results, visible_rows, sun, earth, ts, year, pool)
+    elif CLOSEST_APPROACH_ENGINE != 'daily':
+        with stage('closest_approach'):
+            fill_closest_approaches(all_results, visible_rows, sun, earth, ts, year)
+
+    # เรียงตามเดือน แล้วตามความสว่าง
+    all_results.sort(key=lambda item: (item[1]['month'], item[1]['magnitude']))
+    if return_positions:
+        return all_results
+    return [res for _, res in all_results]
+
+def comet_search_params(sun, max_magnitude=MAX_MAGNITUDE, latitude=LATITUDE, longitude=LONGITUDE,
+                        min_altitude=MIN_MW_ALTITUDE):
+    # พารามิเตอร์ที่มีผลกับผลของแต่ละดวง: เปลี่ยนค่าใดค่าหนึ่งจะคำนวณใหม่ทุกดวง
+    return search_params(
+        ephemeris=ephemeris_id(sun.ephemeris), max_magnitude=max_magnitude,
+        latitude=latitude, longitude=longitude, min_altitude=min_altitude,
+        screening=SCREENING_ENGINE, detailed_check=DETAILED_CHECK,
+        night_step_minutes=NIGHT_STEP_MINUTES if DETAILED_CHECK == 'nightly' else None,
+        closest_approach=CLOSEST_APPROACH_ENGINE, closest_approach_margin_days=CLOSEST_APPROACH_MARGIN_DAYS,
+        tz=str(THAI_TZ),
+        # 2: ผลของดวงที่ชื่อซ้ำกันจับคู่ด้วยตำแหน่งในแคตตาล็อก (ผลที่เก็บก่อนหน้านี้อาจสลับวงโคจรกัน)
+        results_version=2,
+    )
+
+def search_comets_cached(conn, comets, sun, earth, ts, year=SEARCH_YEAR, start_month=START_MONTH,
+                         end_month=END_MONTH, max_magnitude=MAX_MAGNITUDE, latitude=LATITUDE,
+                         longitude=LONGITUDE, min_altitude=MIN_MW_ALTITUDE, verbose=True, workers=1,
+                         ephemeris_path=None):
+    # เหมือน search_comets แต่ใช้ผลที่เก็บไว้ใน conn ของดวงที่ชื่อและวงโคจรไม่เปลี่ยน
+    # คำนวณใหม่เฉพาะดวงที่ยังไม่มีผลครบทุกเดือน แล้วรวมผลเรียงเหมือนคำนวณใหม่ทั้งหมด
+    log = print if verbose else (lambda *args, **kwargs: None)
+    months = range(start_month, end_month + 1)
+    params = comet_search_params(sun, max_magnitude, latitude, longitude, min_altitude)
+    with stage('results_store'):
+        keys = list(zip(comets['designation'], elements_hashes(comets)))
+        cached = load_results(conn, params, year, months, keys)
+    todo = [i for i, key in enumerate(keys) if key not in cached]
+    log(f"♻️  ใช้ผลเดิม {len(keys) - len(todo)} ดวง คำนวณใหม่ {len(todo)} ดวง")
+
+    fresh = {}
+    if todo:
+        results = search_comets(comets.iloc[todo], sun, earth, ts, year, start_month, end_month,
+                                max_magnitude, latitude, longitude, min_altitude, verbose, workers, ephemeris_path,
+                                return_positions=True)
+        # ตำแหน่งที่ได้เป็นของ comets.iloc[todo] แปลงกลับเป็น key (ชื่อ, hash ของวงโคจร) ของแถวนั้น
+        for position, res in results:
+            fresh.setdefault(keys[todo[position]], {})[res['month']] = res
+        with stage('results_store'):
+            save_results(conn, params, year, months, {keys[i]: fresh.get(keys[i], {}) for i in todo})
+
+    # เรียงตามเดือน แล้วตามความสว่าง (เท่ากันเรียงตามลำดับในแคตตาล็อก เหมือน search_comets)
+    combined = []
+    for i, key in enumerate(keys):
+        for res in (cached.get(key) or fresh.get(key, {})).values():
+            if res is not None:
+                combined.append((i, res))
+    combined.sort(key=lambda item: (item[1]['month'], item[1]['magnitude'], item[0]))
+    return [res for _, res in combined]
+
+def find_comets_multi_month():
+    print(f"🚀 เริ่มภารกิจค้นหาดาวหาง ปี {SEARCH_YEAR} (เดือน {START_MONTH} - {END_MONTH})")
+    
+    # 1. โหลดข้อมูลครั้งเดียวใช้ยาวๆ (ดาวน์โหลดใหม่เฉพาะเมื่อข้อมูลที่เก็บไว้เก่าเกินกำหนด)
+    with stage('catalog_load'):
+        comets = load_comet_catalog(max_age_hours=CATALOG_MAX_AGE_HOURS, force=CATALOG_FORCE_RELOAD,
+                                    offline=CATALOG_OFFLINE, local_path=CATALOG_LOCAL_FILE)
+
+    # เปิด de421 ครั้งเดียว ตัดเหลือเฉพาะปีที่ค้นหา (+ ปีข้างเคียงถ้าหา Perigee เลยขอบปี)
+    extra_years = math.ceil(CLOSEST_APPROACH_MARGIN_DAYS / 365)
+    with stage('ephemeris_load'):
+        ts = timescale()
+        eph = ephemeris('de421.bsp', range(SEARCH_YEAR - extra_years, SEARCH_YEAR + extra_years + 1))
+        sun = eph['sun']
+        earth = eph['earth']
+
+    if RESULTS_STORE_FILENAME:
+        conn = open_store(RESULTS_STORE_FILENAME)
+        try:
+            all_results = search_comets_cached(conn, comets, sun, earth, ts, SEARCH_YEAR, START_MONTH, END_MONTH,
+                                               MAX_MAGNITUDE, LATITUDE, LONGITUDE, MIN_MW_ALTITUDE,
+                                               workers=WORKERS, ephemeris_path=eph.path)
+            # ลบผลเก่าของดวงที่หายไปจากแคตตาล็อกหรือวงโคจรเปลี่ยนแล้ว ไม่ให้ไฟล์โตขึ้นเรื่อยๆ
+            if PRUNE_RESULTS_AFTER_DAYS is not None:
+                with stage('results_store'):
+                    prune_store(conn, zip(comets['designation'], elements_hashes(comets)),
+                                older_than_days=PRUNE_RESULTS_AFTER_DAYS)
+        finally:
+            conn.close()
+    else:
+        all_results = search_comets(comets, sun, earth, ts, SEARCH_YEAR, START_MONTH, END_MONTH,
+                                    MAX_MAGNITUDE, LATITUDE, LONGITUDE, MIN_MW_ALTITUDE,
+                                    workers=WORKERS, ephemeris_path=eph.path)
 
     # 3. สรุปผลและ Save
     print("\n" + "="*70)
@@ -156,9 +483,6 @@ def find_comets_multi_month():
     if not all_results:
         print("❌ ไม่พบดาวหางที่ถ่ายได้ตลอดช่วงเวลานี้")
     else:
-        # เรียงตามเดือน แล้วตามความสว่าง
-        all_results.sort(key=lambda x: (x['month'], x['magnitude']))
-        
         for res in all_results:
             print(f"📅 เดือน {res['month']}: {res['name']}")
             print(f"    Mag: {res['magnitude']} | Alt: {res['altitude_max']}° | {res['visibility_period']}")
@@ -167,7 +491,7 @@ def find_comets_multi_month():
 
     if SAVE_JSON and all_results:
         try:
-            with open(JSON_FILENAME, 'w', encoding='utf-8') as f:
+            with stage('save_json'), open(JSON_FILENAME, 'w', encoding='utf-8') as f:
                 json.dump(all_results, f, indent=4, ensure_ascii=False)
             print(f"\n💾 บันทึก JSON รวมสำเร็จ: {os.path.abspath(JSON_FILENAME)}")
         except Exception as e:
@@ -0,0 +1,255 @@
+from skyfield.constants import AU_KM, C_AUDAY, GM_SUN_Pitjeva_2005_km3_s2
+from skyfield.data.spice import inertial_frames
+import numpy as np
+
+# คำนวณวงโคจรดาวหางทั้งแคตตาล็อกพร้อมกันด้วย NumPy (แทนการสร้าง mpc.comet_orbit ทีละดวง)
+# ใช้ universal variable ของสมการเคปเลอร์ จึงรองรับวงรี พาราโบลา และไฮเพอร์โบลาในสูตรเดียว
+
+# ค่า GM ของดวงอาทิตย์ในหน่วย AU^3/day^2 (ค่าเดียวกับที่ใช้กับ mpc.comet_orbit)
+GM_SUN_AU3_D2 = GM_SUN_Pitjeva_2005_km3_s2 * 86400.0 ** 2 / AU_KM ** 3
+
+# ธาตุวงโคจรของ MPC อ้างอิงระนาบสุริยวิถี J2000 ต้องหมุนเข้ากรอบ ICRS
+ECLIPTIC_TO_ICRS = inertial_frames['ECLIPJ2000'].T
+
+# คอลัมน์ความสว่าง M1 ที่อาจพบในแต่ละเวอร์ชันของ dataframe (ใช้คอลัมน์แรกที่มี)
+MAGNITUDE_COLUMNS = ('magnitude_g', 'magnitude_m1', 'M1')
+SLOPE_COLUMNS = ('magnitude_k', 'K')
+DEFAULT_K = 10.0
+
+def _first_column(comets, names, default):
+    for name in names:
+        if name in comets.columns:
+            return comets[name].to_numpy(dtype=float)
+    return np.full(len(comets), default, dtype=float)
+
+def orbital_elements(comets, ts):
+    # แปลง dataframe ของ MPC เป็น dict ของ NumPy array (1 ค่าต่อดาวหาง)
+    q = comets['perihelion_distance_au'].to_numpy(dtype=float)
+    e = comets['eccentricity'].to_numpy(dtype=float)
+    w = np.radians(comets['argument_of_perihelion_degrees'].to_numpy(dtype=float))
+    node = np.radians(comets['longitude_of_ascending_node_degrees'].to_numpy(dtype=float))
+    inc = np.radians(comets['inclination_degrees'].to_numpy(dtype=float))
+
+    # เวลาผ่านจุดใกล้ดวงอาทิตย์ที่สุด (TT) เหมือน mpc.comet_orbit
+    year = comets['perihelion_year'].to_numpy(dtype=float)
+    month = comets['perihelion_month'].to_numpy(dtype=float)
+    day = comets['perihelion_day'].to_numpy(dtype=float)
+    valid = np.isfinite(year) & np.isfinite(month) & np.isfinite(day)
+    tp = np.full(len(comets), np.nan)
+    if valid.any():
+        tp[valid] = ts.tt(year[valid].astype(int), month[valid].astype(int), day[valid]).tt
+
+    # เวกเตอร์หนึ่งหน่วย P (ชี้ไปจุดใกล้ดวงอาทิตย์ที่สุด) และ Q ในระนาบวงโคจร แล้วหมุนเข้า ICRS
+    cw, sw = np.cos(w), np.sin(w)
+    cn, sn = np.cos(node), np.sin(node)
+    ci, si = np.cos(inc), np.sin(inc)
+    p_vec = np.array([cw * cn - sw * sn * ci, cw * sn + sw * cn * ci, sw * si])
+    q_vec = np.array([-sw * cn - cw * sn * ci, -sw * sn + cw * cn * ci, cw * si])
+
+    m1 = _first_column(comets, MAGNITUDE_COLUMNS, np.nan)
+    k = _first_column(comets, SLOPE_COLUMNS, DEFAULT_K)
+    k = np.where(np.isnan(k), DEFAULT_K, k)
+
+    return {
+        'q': q,
+        'e': e,
+        'tp': tp,
+        'p_vec': ECLIPTIC_TO_ICRS @ p_vec,
+        'q_vec': ECLIPTIC_TO_ICRS @ q_vec,
+        'm1': m1,
+        'k': k,
+    }
+
+def select_elements(elements, index):
+    # เลือกบางดวงจาก elements (index เป็น array ของตำแหน่ง หรือ boolean mask)
+    return {name: (value[:, index] if value.ndim == 2 else value[index]) for name, value in elements.items()}
+
+def _stumpff(z):
+    # ฟังก์ชัน Stumpff C(z), S(z) สำหรับวงรี (z > 0) ไฮเพอร์โบลา (z < 0) และใกล้พาราโบลา (z ~ 0)
+    c = np.empty_like(z)
+    s = np.empty_like(z)
+    pos = z > 1e-3
+    neg = z < -1e-3
+    small = ~(pos | neg)
+
+    sz = np.sqrt(z[pos])
+    c[pos] = (1.0 - np.cos(sz)) / z[pos]
+    s[pos] = (sz - np.sin(sz)) / sz ** 3
+
+    sz = np.sqrt(-z[neg])
+    c[neg] = (np.cosh(sz) - 1.0) / -z[neg]
+    s[neg] = (np.sinh(sz) - sz) / sz ** 3
+
+    zs = z[small]
+    c[small] = 1.0 / 2 - zs / 24 + zs ** 2 / 720 - zs ** 3 / 40320
+    s[small] = 1.0 / 6 - zs / 120 + zs ** 2 / 5040 - zs ** 3 / 362880
+    return c, s
+
+def heliocentric_positions(elements, tt, max_iterations=50):
+    # ตำแหน่งดาวหางเทียบดวงอาทิตย์ (ICRS, AU) ที่เวลา tt
+    # tt มี shape (n_times,) = เวลาเดียวกันทุกดวง หรือ (n_comets, n_times) = เวลาแยกรายดวง
+    # คืนค่า shape (3, n_comets, n_times)
+    q = elements['q'][:, None]
+    e = elements['e'][:, None]
+    tt = np.asarray(tt, dtype=float)
+    if tt.ndim < 2:
+        tt = np.atleast_1d(tt)[None, :]
+    dt = tt - elements['tp'][:, None]
+    q, e, dt = np.broadcast_arrays(q, e, dt)
+
+    mu = GM_SUN_AU3_D2
+    sqrt_mu = np.sqrt(mu)
+    alpha = (1.0 - e) / q
+
+    # วงรี: ตัดจำนวนรอบเต็มออกก่อน เพื่อให้การวนหาคำตอบลู่เข้าเร็ว
+    with np.errstate(divide='ignore', invalid='ignore'):
+        period = np.where(alpha > 0, 2 * np.pi / np.sqrt(mu * np.abs(alpha) ** 3), np.inf)
+        dt = np.where(np.isfinite(period), dt - period * np.round(dt / period), dt)
+
+    # ค่าเริ่มต้นจากคำตอบแบบพาราโบลา (สมการกำลังสามของ Barker)
+    e_guess = np.maximum(e, 1e-3)
+    p = 6.0 * q / e_guess
+    r = -6.0 * sqrt_mu * dt / e_guess
+    disc = np.sqrt((r / 2) ** 2 + (p / 3) ** 3)
+    chi = np.cbrt(-r / 2 + disc) + np.cbrt(-r / 2 - disc)
+
+    # Laguerre-Conway: ลู่เข้าแทบทุกกรณีของ e
+    n = 5.0
+    target = sqrt_mu * dt
+    active = np.isfinite(chi)
+    for _ in range(max_iterations):
+        z = alpha * chi * chi
+        c, s = _stumpff(z)
+        f = q * chi + e * chi ** 3 * s - target
+        f1 = q + e * chi * chi * c
+        f2 = e * chi * (1.0 - z * s)
+        root = np.sqrt(np.abs((n - 1) ** 2 * f1 * f1 - n * (n - 1) * f * f2))
+        delta = n * f / (f1 + np.copysign(root, f1))
+        delta = np.where(active, delta, 0.0)
+        chi = chi - delta
+        active &= np.abs(delta) > 1e-12 * (1.0 + np.abs(chi))
+        if not active.any():
+            break
+
+    # Lagrange f, g: r = f * r0 + g * v0 (ที่จุดใกล้ดวงอาทิตย์ที่สุด r0 = q P, v0 = v_q Q)
+    z = alpha * chi * chi
+    c, s = _stumpff(z)
+    f = 1.0 - chi * chi * c / q
+    g = dt - chi ** 3 * s / sqrt_mu
+    x = f * q
+    y = g * np.sqrt(mu * (1.0 + e) / q)
+
+    p_vec = elements['p_vec'][:, :, None]
+    q_vec = elements['q_vec'][:, :, None]
+    return x * p_vec + y * q_vec
+
+def _light_time_vectors(elements, sun_au, observer_au, tt, light_time_iterations):
+    # เวกเตอร์ดาวหางเทียบดวงอาทิตย์ และเทียบผู้สังเกต ณ เวลาที่แสงออกจากดาวหาง shape (3, n_comets, n_times)
+    sun = sun_au if sun_au.ndim == 3 else sun_au[:, None, :]
+    observer = observer_au if observer_au.ndim == 3 else observer_au[:, None, :]
+
+    helio = heliocentric_positions(elements, tt)
+    geo = helio + sun - observer
+    for _ in range(light_time_iterations):
+        delta = np.sqrt((geo * geo).sum(axis=0))
+        helio = heliocentric_positions(elements, tt - delta / C_AUDAY)
+        geo = helio + sun - observer
+    return helio, geo
+
+def comet_distances(elements, sun_au, earth_au, tt, light_time_iterations=2):
+    # ระยะจากดวงอาทิตย์ (r) และจากโลก (delta) หน่วย AU แก้ค่า light-time แบบเดียวกับ observe()
+    # sun_au, earth_au = ตำแหน่ง barycentric ที่เวลา tt
+    # เวลาเดียวกันทุกดวง: shape (3, n_times) กับ tt (n_times,)
+    # เวลาแยกรายดวง: shape (3, n_comets, n_times) กับ tt (n_comets, n_times)
+    helio, geo = _light_time_vectors(elements, sun_au, earth_au, tt, light_time_iterations)
+    r = np.sqrt((helio * helio).sum(axis=0))
+    delta = np.sqrt((geo * geo).sum(axis=0))
+    return r, delta
+
+def comet_magnitudes(elements, r, delta):
+    # แบบจำลองความสว่าง M1 + 5 log10(delta) + K log10(r) ดวงที่ไม่มีข้อมูลให้เป็น 999 (ไม่ผ่านเกณฑ์)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        mag = elements['m1'][:, None] + 5 * np.log10(delta) + elements['k'][:, None] * np.log10(r)
+    return np.where(np.isfinite(mag), mag, 999.0)
+
+def screen_magnitudes(elements, sun, earth, t):
+    # ความสว่างโดยประมาณของทุกดาวหาง ณ ทุกเวลาใน t: shape (n_comets, n_times)
+    sun_au = sun.at(t).position.au.reshape(3, -1)
+    earth_au = earth.at(t).position.au.reshape(3, -1)
+    r, delta = comet_distances(elements, sun_au, earth_au, np.atleast_1d(t.tt))
+    return comet_magnitudes(elements, r, delta)
+
+def comet_altaz(elements, sun, earth, topos, t, light_time_iterations=2):
+    # มุมสูงและมุมทิศ (องศา) ของทุกดาวหาง ณ ทุกเวลาใน t เห็นจาก topos: shape (n_comets, n_times)
+    # หมุนเวกเตอร์ astrometric เข้ากรอบขอบฟ้าของสถานที่ด้วย rotation_at (ไม่แก้ aberration ต่างกันไม่ถึง 1 ลิปดา)
+    tt = np.atleast_1d(t.tt)
+    sun_au = sun.at(t).position.au.reshape(3, -1)
+    observer_au = (earth + topos).at(t).position.au.reshape(3, -1)
+    _, geo = _light_time_vectors(elements, sun_au, observer_au, tt, light_time_iterations)
+
+    rotation = topos.rotation_at(t).reshape(3, 3, -1)
+    local = np.einsum('ijm,jnm->inm', rotation, geo)
+    alt = np.degrees(np.arctan2(local[2], np.hypot(local[0], local[1])))
+    az = np.degrees(np.arctan2(local[1], local[0])) % 360.0
+    return alt, az
+
+def nightly_windows(alt, sun_alt, min_altitude, sun_limit=-12.0):
+    # หาช่วงที่ถ่ายได้รายคืน จากมุมสูงดาวหาง shape (n_comets, n_nights, n_steps)
+    # และมุมสูงดวงอาทิตย์ shape (n_nights, n_steps) (ตารางเวลาเดียวกันทุกดวง)
+    # คืนค่า (มีช่วงถ่ายได้หรือไม่, index แรก, index สุดท้าย, index ที่มุมสูงที่สุด) shape (n_comets, n_nights)
+    visible = (alt > min_altitude) & (sun_alt < sun_limit)[None, :, :]
+    has_window = visible.any(axis=2)
+    first = visible.argmax(axis=2)
+    last = visible.shape[2] - 1 - visible[:, :, ::-1].argmax(axis=2)
+    peak = np.where(visible, alt, -np.inf).argmax(axis=2)
+    return has_window, first, last, peak
+
+def _geocentric_distance_at(elements, sun, earth, ts, tt):
+    # ระยะจากโลกของแต่ละดวง ณ เวลาของดวงนั้นเอง (tt shape (n_comets,))
+    t = ts.tt_jd(tt)
+    sun_au = sun.at(t).position.au[:, :, None]
+    earth_au = earth.at(t).position.au[:, :, None]
+    _, delta = comet_distances(elements, sun_au, earth_au, tt[:, None])
+    return delta[:, 0]
+
+def closest_approach(elements, sun, earth, ts, year, margin_days=0, tolerance_minutes=1.0):
+    # หาวันเวลาที่ใกล้โลกที่สุดในปี (Perigee) ของทุกดวงพร้อมกัน
+    # 1) สแกนหยาบรายวันทั้งปี (ดวง x วัน) 2) Golden-section search รอบจุดต่ำสุดของแต่ละดวงพร้อมกัน
+    # margin_days > 0 จะค้นหาเลยขอบปีออกไปทั้งสองฝั่ง (เช่น Perigee ปลายธันวาคม/ต้นมกราคม)
+    # คืนค่า (tt ของจุดที่ใกล้ที่สุด, ระยะ AU) shape (n_comets,)
+    days = np.arange(1 - margin_days, 367 + margin_days)
+    t = ts.utc(year, 1, days)
+    tt_grid = t.tt
+    _, delta = comet_distances(elements, sun.at(t).position.au, earth.at(t).position.au, tt_grid)
+
+    n = len(elements['q'])
+    if n == 0:
+        return np.empty(0), np.empty(0)
+    best = np.nanargmin(np.where(np.isnan(delta), np.inf, delta), axis=1)
+    lo = tt_grid[np.maximum(best - 1, 0)]
+    hi = tt_grid[np.minimum(best + 1, len(tt_grid) - 1)]
+
+    # Golden-section ทุกดวงในรอบเดียวกัน รอบละ 1 Skyfield call
+    ratio = (np.sqrt(5.0) - 1) / 2
+    c = hi - ratio * (hi - lo)
+    d = lo + ratio * (hi - lo)
+    fc = _geocentric_distance_at(elements, sun, earth, ts, c)
+    fd = _geocentric_distance_at(elements, sun, earth, ts, d)
+    while (hi - lo).max() * 1440 > tolerance_minutes:
+        left = fc < fd
+        hi = np.where(left, d, hi)
+        lo = np.where(left, lo, c)
+        new_point = np.where(left, hi - ratio * (hi - lo), lo + ratio * (hi - lo))
+        f_new = _geocentric_distance_at(elements, sun, earth, ts, new_point)
+        c, d, fc, fd = (np.where(left, new_point, d), np.where(left, c, new_point),
+                        np.where(left, f_new, fd), np.where(left, fc, f_new))
+
+    tt_min = (lo + hi) / 2
+    dist_min = _geocentric_distance_at(elements, sun, earth, ts, tt_min)
+
+    # ถ้าผลละเอียดแย่กว่าจุดบนตารางหยาบ (เช่นข้อมูลผิดปกติ) ใช้ค่าจากตารางหยาบแทน
+    coarse = delta[np.arange(n), best]
+    worse = ~(dist_min <= coarse)
+    tt_min[worse] = tt_grid[best[worse]]
+    dist_min[worse] = coarse[worse]
+    return tt_min, dist_min
@@ -0,0 +1,91 @@
+from datetime import datetime, timedelta
+import hashlib
+import sqlite3
+import json
+
+from _milkyway_state_cache import cache_key
+
+# =================ตั้งค่าฐานข้อมูลผลค้นหาดาวหาง=================
+# เก็บผลของดาวหางแต่ละดวงแต่ละเดือนลง SQLite โดยใช้ชื่อ + hash ของวงโคจร + พารามิเตอร์การค้นหา/สถานที่ เป็น key
+# ไฟล์ CometEls.txt ใหม่ที่เปลี่ยนแค่ไม่กี่ดวง จะคำนวณใหม่เฉพาะดวงที่เพิ่มมาหรือวงโคจรเปลี่ยน
+STORE_FILENAME = 'comet_results.sqlite'
+# ====================================================
+
+SCHEMA = """
+-- result เป็น JSON ของผลเดือนนั้น (รวม closest_approach) หรือ NULL ถ้าดวงนั้นไม่ผ่านเกณฑ์ในเดือนนั้น
+CREATE TABLE IF NOT EXISTS comet_months (
+    params_hash TEXT NOT NULL,
+    designation TEXT NOT NULL,
+    elements_hash TEXT NOT NULL,
+    year INTEGER NOT NULL,
+    month INTEGER NOT NULL,
+    result TEXT,
+    computed_at TEXT NOT NULL,
+    PRIMARY KEY (params_hash, designation, elements_hash, year, month)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS search_params (
+    params_hash TEXT PRIMARY KEY,
+    params TEXT NOT NULL
+);
+"""
+
+def open_store(path=STORE_FILENAME):
+    conn = sqlite3.connect(path)
+    conn.executescript(SCHEMA)
+    return conn
+
+def elements_hashes(comets):
+    # hash ของทุกคอลัมน์ยกเว้นชื่อ (วงโคจร ความสว่าง และ reference ของ MPC) ทีละดวง
+    columns = [name for name in comets.columns if name != 'designation']
+    hashes = []
+    for values in comets[columns].itertuples(index=False, name=None):
+        text = json.dumps(values, default=str)
+        hashes.append(hashlib.sha1(text.encode('utf-8')).hexdigest()[:16])
+    return hashes
+
+def search_params(**parts):
+    # พารามิเตอร์ทั้งหมดที่มีผลกับผลของดาวหางแต่ละดวง (ไม่รวมปี/เดือน ซึ่งเป็นส่วนหนึ่งของ key) คืน (hash, dict)
+    return cache_key(kind='comet_search', **parts)
+
+def load_results(conn, params, year, months, keys):
+    # คืน {(designation, elements_hash): {เดือน: ผล หรือ None}} เฉพาะดวงที่มีผลครบทุกเดือนใน months
+    digest, _ = params
+    months = list(months)
+    found = {}
+    rows = conn.execute("SELECT designation, elements_hash, month, result FROM comet_months "
+                        "WHERE params_hash = ? AND year = ? AND month BETWEEN ? AND ?",
+                        (digest, year, min(months), max(months)))
+    wanted = set(keys)
+    for designation, elements_hash, month, result in rows:
+        key = (designation, elements_hash)
+        if key in wanted:
+            found.setdefault(key, {})[month] = json.loads(result) if result is not None else None
+    return {key: entries for key, entries in found.items() if all(m in entries for m in months)}
+
+def save_results(conn, params, year, months, entries):
+    # entries = {(designation, elements_hash): {เดือน: ผล}} เดือนที่ไม่มีใน dict บันทึกเป็น NULL (ไม่ผ่านเกณฑ์)
+    digest, parts = params
+    now = datetime.now().isoformat(timespec='seconds')
+    rows = []
+    for (designation, elements_hash), results in entries.items():
+        for month in months:
+            result = results.get(month)
+            rows.append((digest, designation, elements_hash, year, month,
+                         json.dumps(result, ensure_ascii=False) if result is not None else None, now))
+    with conn:
+        conn.execute("INSERT OR REPLACE INTO search_params VALUES (?, ?)",
+                     (digest, json.dumps(parts, sort_keys=True, default=str)))
+        conn.executemany("INSERT OR REPLACE INTO comet_months VALUES (?, ?, ?, ?, ?, ?, ?)", rows)
+
+def prune_store(conn, keys, older_than_days=0):
+    # ลบผลของดวงที่ไม่มีในแคตตาล็อกปัจจุบันแล้ว (หรือวงโคจรเปลี่ยน) ทุกพารามิเตอร์ คืนจำนวนดวงที่ลบ
+    # เฉพาะผลที่คำนวณไว้นานกว่า older_than_days วัน (รันด้วยแคตตาล็อกย่อยครั้งเดียวจะไม่ลบผลของแคตตาล็อกจริง)
+    wanted = set(keys)
+    cutoff = (datetime.now() - timedelta(days=older_than_days)).isoformat(timespec='seconds')
+    stale = [key for key in conn.execute("SELECT DISTINCT designation, elements_hash FROM comet_months "
+                                         "WHERE computed_at < ?", (cutoff,))
+             if key not in wanted]
+    with conn:
+        conn.executemany("DELETE FROM comet_months WHERE designation = ? AND elements_hash = ? "
+                         "AND computed_at < ?", [(*key, cutoff) for key in stale])
+    return len(stale)
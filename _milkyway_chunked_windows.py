@@ -0,0 +1,133 @@
+from datetime import datetime, timedelta, date
+import numpy as np
+import gc
+import os
+
+import _milkyway_create_data_set as mw
+from _milkyway_create_data_set_by_sites import geocentric_state, site_mask, site_windows, SITES
+from _milkyway_output import write_records
+from _stargazing_profile import stage
+from _stargazing_ephemeris import ephemeris, timescale
+
+# =================ตั้งค่าการคำนวณแบ่งช่วง (หลายปี x หลายสถานที่)=================
+# คำนวณต่อเนื่องทีละช่วง (block) ของคืน แทนการสร้าง array ของทั้งช่วงปีพร้อมกัน
+# ขนาด block เลือกให้หน่วยความจำสูงสุดไม่เกิน MEMORY_LIMIT_MB (เช่น 10 ปี x ทุก 1 นาที x หลายร้อยสถานที่)
+START_YEAR = 2026
+END_YEAR = 2035
+STEP_MINUTES = 1
+MEMORY_LIMIT_MB = 512
+
+# จำนวนคืนสูงสุดต่อ block (None = มากที่สุดที่ไม่เกิน MEMORY_LIMIT_MB)
+BLOCK_NIGHTS = None
+
+# เก็บตำแหน่ง/เฟสดวงจันทร์ของ block เป็น float32 (ครึ่งหนึ่งของ float64 มุมสูงต่างกันไม่ถึง 0.1")
+STATE_FLOAT32 = True
+
+CHUNK_SITES = SITES
+
+# ไฟล์ผลลัพธ์ (.jsonl / .csv / .ics) บันทึกทีละ block ทีละสถานที่
+OUTPUT_FILENAME = 'milkyway_windows_chunked.jsonl'
+# ====================================================
+
+# หน่วยความจำต่อ 1 เวลาในตาราง (byte) วัดด้วย tracemalloc แล้วเผื่อไว้
+# - สร้างตารางเวลาและคำนวณ state จากใจกลางโลก (Skyfield observe/apparent ของดวงอาทิตย์ ดวงจันทร์ เฟส + cache ใน Time)
+# - แปลง state เป็นมุมสูง/mask ของสถานที่หนึ่ง (ทำทีละสถานที่ จึงไม่เพิ่มตามจำนวนสถานที่)
+GEOCENTRIC_BYTES_PER_SAMPLE = 2304
+SITE_BYTES_PER_SAMPLE = 192
+
+def state_bytes_per_sample(float32=STATE_FLOAT32):
+    # tt + gast (float64) + เฟสดวงจันทร์ + ตำแหน่ง xyz ของดวงอาทิตย์ ดวงจันทร์ ใจกลางทางช้างเผือก
+    return 16 + 10 * (4 if float32 else 8)
+
+def block_bytes(nights, sites_count, step_minutes=STEP_MINUTES, float32=STATE_FLOAT32):
+    # ประมาณหน่วยความจำสูงสุดของ 1 block: ตอนคำนวณ state หรือตอนคำนวณ mask ของแต่ละสถานที่
+    # (state ของ block + งานของสถานที่หนึ่ง + mask แบบ packed bits ของทุกสถานที่)
+    steps = mw.NIGHT_HOURS * 60 // step_minutes
+    samples = nights * steps
+    packed = sites_count * nights * ((steps + 7) // 8)
+    sites_peak = samples * (state_bytes_per_sample(float32) + SITE_BYTES_PER_SAMPLE) + packed
+    return max(samples * GEOCENTRIC_BYTES_PER_SAMPLE, sites_peak)
+
+def nights_per_block(sites_count, memory_limit_mb=MEMORY_LIMIT_MB, step_minutes=STEP_MINUTES,
+                     float32=STATE_FLOAT32, max_nights=BLOCK_NIGHTS):
+    # จำนวนคืนมากที่สุดต่อ block ที่ไม่เกิน memory_limit_mb ถ้าแค่คืนเดียวก็เกินแล้วจะ raise MemoryError
+    limit = memory_limit_mb * 1024 * 1024
+    per_night = block_bytes(1, sites_count, step_minutes, float32)
+    nights = int(limit // per_night)
+    if nights < 1:
+        raise MemoryError(f"MEMORY_LIMIT_MB = {memory_limit_mb} ไม่พอสำหรับ 1 คืน "
+                          f"(ต้องการอย่างน้อย {per_night / 1024 / 1024:.1f} MB ที่ step {step_minutes} นาที)")
+    return min(nights, max_nights) if max_nights else nights
+
+def block_state(eph, ts, check_start, nights, step_minutes=STEP_MINUTES, float32=STATE_FLOAT32):
+    # state จากใจกลางโลกของ block เดียว Time ของตารางถูกทิ้งหลังคำนวณ (cache ภายใน Time ใหญ่กว่า state หลายเท่า)
+    # Time อ้างอิงวนกันเอง จึงต้อง gc.collect() ไม่อย่างนั้น cache ของหลาย block จะค้างอยู่จนเกิน MEMORY_LIMIT_MB
+    minutes, t = mw.build_night_grid(ts, check_start, nights, step_minutes)
+    state = geocentric_state(eph, t)
+    del t
+    gc.collect()
+    if float32:
+        for name in ('moon_phase', 'sun', 'moon', 'mw'):
+            state[name] = state[name].astype(np.float32)
+    return state, minutes
+
+def iter_block_masks(eph, ts, sites, start_year=START_YEAR, end_year=END_YEAR, min_mw_altitude=None,
+                     step_minutes=STEP_MINUTES, memory_limit_mb=MEMORY_LIMIT_MB, float32=STATE_FLOAT32,
+                     max_nights=BLOCK_NIGHTS):
+    # ส่ง (เวลาเริ่มคืนแรกของ block, นาที, state, masks) ออกทีละ block
+    # masks = packed bits ขนาด (สถานที่ x คืน x ceil(step / 8)) ใช้ np.unpackbits(..., axis=-1, count=step) อ่านกลับ
+    # คืนทั้งหมดตั้งแต่ 1 ม.ค. start_year ถึง 31 ธ.ค. end_year ต่อเนื่องกัน (ปีอธิกสุรทินได้ 366 คืน)
+    min_mw_altitude = mw.MIN_MW_ALTITUDE if min_mw_altitude is None else min_mw_altitude
+    first_check = datetime(start_year, 1, 1, 12, 0, 0, tzinfo=mw.TZ).replace(hour=18)
+    total_nights = (date(end_year + 1, 1, 1) - date(start_year, 1, 1)).days
+    block = nights_per_block(len(sites), memory_limit_mb, step_minutes, float32, max_nights)
+
+    for offset in range(0, total_nights, block):
+        nights = min(block, total_nights - offset)
+        # คืนไม่ถูกตัดกลาง block: ทุก block เริ่ม 18:00 และช่วงข้ามเที่ยงคืนอยู่ในแถวเดียวกันของตาราง
+        check_start = first_check + timedelta(days=offset)
+        state = masks = None # ปล่อย block ก่อนหน้าก่อนคำนวณ block ใหม่
+        with stage('geocentric_state'):
+            state, minutes = block_state(eph, ts, check_start, nights, step_minutes, float32)
+        masks = np.empty((len(sites), nights, (minutes.shape[1] + 7) // 8), dtype=np.uint8)
+        with stage('site_masks'):
+            for i, site in enumerate(sites):
+                masks[i] = np.packbits(site_mask(state, minutes, site, min_mw_altitude), axis=1)
+        yield check_start, minutes, state, masks
+
+def iter_chunked_windows(eph, ts, sites, start_year=START_YEAR, end_year=END_YEAR, min_mw_altitude=None,
+                         refine=None, step_minutes=STEP_MINUTES, memory_limit_mb=MEMORY_LIMIT_MB,
+                         float32=STATE_FLOAT32, max_nights=BLOCK_NIGHTS):
+    # ส่งรายการ {"Site", "Latitude", "Longitude", "Date", "Start", "End"} ทีละ block ทีละสถานที่ (เรียงตามวันในแต่ละสถานที่)
+    # ใช้ mask จาก iter_block_masks และปรับขอบด้วย state ของ block เดียวกัน
+    min_mw_altitude = mw.MIN_MW_ALTITUDE if min_mw_altitude is None else min_mw_altitude
+    refine = mw.REFINE_EDGES if refine is None else refine
+    blocks = iter_block_masks(eph, ts, sites, start_year, end_year, min_mw_altitude, step_minutes,
+                              memory_limit_mb, float32, max_nights)
+    for check_start, minutes, state, masks in blocks:
+        for site, packed in zip(sites, masks):
+            mask = np.unpackbits(packed, axis=-1, count=minutes.shape[1]).astype(bool)
+            with stage('site_windows'):
+                records = site_windows(state, check_start, minutes, site, min_mw_altitude, refine, mask=mask)
+            for r in records:
+                yield {"Site": site['name'], "Latitude": site['latitude'], "Longitude": site['longitude'], **r}
+        state = masks = packed = mask = None # ปล่อย block นี้ก่อนคำนวณ block ถัดไป
+
+def calculate_milkyway_window_chunked():
+    sites = CHUNK_SITES
+    block = nights_per_block(len(sites), MEMORY_LIMIT_MB, STEP_MINUTES, STATE_FLOAT32, BLOCK_NIGHTS)
+    print(f"กำลังคำนวณปี {START_YEAR}-{END_YEAR} สำหรับ {len(sites)} สถานที่ ทุก {STEP_MINUTES} นาที "
+          f"(block ละ {block} คืน ไม่เกิน {MEMORY_LIMIT_MB} MB)...")
+
+    with stage('ephemeris_load'):
+        eph = ephemeris('de440s.bsp', range(START_YEAR, END_YEAR + 1))
+        ts = timescale()
+
+    with stage('stream_output'):
+        records = iter_chunked_windows(eph, ts, sites, START_YEAR, END_YEAR, step_minutes=STEP_MINUTES,
+                                       memory_limit_mb=MEMORY_LIMIT_MB, float32=STATE_FLOAT32, max_nights=BLOCK_NIGHTS)
+        count = write_records(records, OUTPUT_FILENAME)
+    print(f"\nบันทึก {count} รายการสำเร็จ: {os.path.abspath(OUTPUT_FILENAME)}")
+
+if __name__ == "__main__":
+    calculate_milkyway_window_chunked()
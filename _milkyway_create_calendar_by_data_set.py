@@ -1,14 +1,24 @@
 import matplotlib.pyplot as plt
-import matplotlib.dates as mdates
 import matplotlib.image as mpimg
-from datetime import datetime, timedelta
+from matplotlib.collections import PolyCollection
+from matplotlib.figure import Figure
+from concurrent.futures import ProcessPoolExecutor
 import pandas as pd
 import numpy as np
+import os
+import re
+
+from _milkyway_output import read_records
+from _stargazing_profile import stage, profiled
 
 # --- 1. ตั้งค่าชื่อไฟล์รูปภาพพื้นหลัง ---
 bg_image_path = 'background_.jpg' # เปลี่ยนเป็นชื่อไฟล์ของคุณ
 
 # --- 2. ข้อมูล (Data) ---
+# อ่านจากไฟล์ที่ _milkyway_create_data_set.py บันทึกไว้ (.jsonl / .csv / .ics / .json) แทนการวาง data เอง
+# None = ใช้ data ด้านล่าง, site_name = เลือกเฉพาะสถานที่ (ไฟล์จาก _milkyway_create_data_set_by_sites.py)
+data_file = None
+site_name = None
 data = [
     {"Date": "2026-10-01", "Start": "19:00", "End": "21:10"},
     {"Date": "2026-10-02", "Start": "19:00", "End": "21:10"},
@@ -29,97 +39,177 @@ data = [
     {"Date": "2026-10-30", "Start": "18:50", "End": "19:20"}
 ]
 
+# --- ตั้งค่าการสร้างรูป ---
+output_file = 'milkyway_.png'
+# False = ไม่เปิดหน้าต่างกราฟ (เช่นรันบน server) บันทึกไฟล์อย่างเดียว
+show_window = True
+
+# สร้างหลายรูปในครั้งเดียว: แยกตาม 'site' / 'month' / 'year' (หรือหลายอย่าง เช่น ('site', 'year'))
+# None = สร้างรูปเดียวแบบเดิม, รูปทั้งหมดบันทึกใน batch_output_dir ใช้ batch_workers process (None = จำนวน core)
+batch_by = None
+batch_output_dir = 'milkyway_charts'
+batch_workers = None
+
 # --- 3. เตรียมข้อมูล ---
-df = pd.DataFrame(data)
-
-def time_to_plot_val(t_str):
-    h, m = map(int, t_str.split(':'))
-    val = h + m/60
-    if val < 12: # ถ้าหลังเที่ยงคืน ให้บวก 24 เพื่อให้กราฟต่อเนื่องไปทางขวา
-        val += 24
-    return val
-
-def get_night_date(row):
-    date_obj = pd.to_datetime(row['Date'])
-    h, _ = map(int, row['Start'].split(':'))
-    if h < 12: # เช้ามืด ให้นับเป็นคืนก่อนหน้า
-        return date_obj - timedelta(days=1)
-    return date_obj
-
-df['Start_Val'] = df['Start'].apply(time_to_plot_val)
-df['End_Val'] = df['End'].apply(time_to_plot_val)
-df['Duration'] = df['End_Val'] - df['Start_Val']
-df['Night_Date'] = df.apply(get_night_date, axis=1)
-
-# เรียงลำดับข้อมูลตามวันที่
-df = df.sort_values(by='Night_Date').reset_index(drop=True)
+def _plot_vals(times):
+    # "HH:MM" ทั้งคอลัมน์เป็นชั่วโมงทศนิยม ถ้าหลังเที่ยงคืน ให้บวก 24 เพื่อให้กราฟต่อเนื่องไปทางขวา
+    hm = times.str.split(':', expand=True).astype(int)
+    val = hm[0] + hm[1] / 60
+    return val.where(val >= 12, val + 24), hm[0]
+
+@profiled()
+def prepare_frame(records):
+    # เตรียมข้อมูลทั้งตารางในครั้งเดียว (ไม่ใช้ apply ทีละแถว)
+    df = pd.DataFrame(list(records))
+    df['Start_Val'], start_hour = _plot_vals(df['Start'])
+    df['End_Val'], _ = _plot_vals(df['End'])
+    df['Duration'] = df['End_Val'] - df['Start_Val']
+    # เช้ามืด ให้นับเป็นคืนก่อนหน้า
+    df['Night_Date'] = pd.to_datetime(df['Date']) - pd.to_timedelta((start_hour < 12).astype(int), unit='D')
+
+    # เรียงลำดับข้อมูลตามวันที่
+    return df.sort_values(by='Night_Date').reset_index(drop=True)
+
+def split_frame(df, by):
+    # แบ่งข้อมูลเป็นหลายชุดตามสถานที่/เดือน/ปี คืน dict {ชื่อ: DataFrame}
+    keys = [by] if isinstance(by, str) else list(by)
+    columns = {
+        'site': df['Site'] if 'Site' in df.columns else pd.Series('site', index=df.index),
+        'month': df['Night_Date'].dt.strftime('%Y-%m'),
+        'year': df['Night_Date'].dt.strftime('%Y'),
+    }
+    groups = df.groupby([columns[key] for key in keys], sort=True)
+    return {'_'.join(str(v) for v in (name if isinstance(name, tuple) else (name,))): group.reset_index(drop=True)
+            for name, group in groups}
+
+def load_background(path):
+    # อ่านรูปพื้นหลังครั้งเดียว (ใช้ซ้ำทุกกราฟ) ถ้าไม่มีไฟล์คืน None
+    try:
+        return mpimg.imread(path)
+    except FileNotFoundError:
+        print(f"Warning: Image file '{path}' not found. Using dark background.")
+        return None
 
 # --- 4. สร้างกราฟ ---
-plt.style.use('dark_background')
-
-# คำนวณความสูงรูปกราฟ (High Resolution Height)
-row_height = 0.4 # ความสูงต่อ 1 แถวข้อมูล (นิ้ว)
-fig_height = max(8, len(df) * row_height) 
-fig, ax = plt.subplots(figsize=(15, fig_height))
-
-# ** หัวใจสำคัญ: ใช้ index (0, 1, 2...) เป็นแกน Y แทนวันที่จริง **
-# เพื่อให้กราฟเรียงติดกันโดยไม่มีช่องว่างของวันที่หายไป
-y_positions = np.arange(len(df))
-
-# วาดกราฟแท่ง
-bars = ax.barh(y_positions, df['Duration'], left=df['Start_Val'], 
-               color='#FFCC80', edgecolor='white', height=0.6, alpha=0.9, zorder=3)
-
-# ใส่ข้อความกำกับเวลาท้ายแท่ง
-for i, bar in enumerate(bars):
-    duration_mins = int(round(df['Duration'].iloc[i] * 60))
-    # ปรับตำแหน่งข้อความ
-    x_pos = bar.get_x() + bar.get_width() + 0.1
-    y_pos = bar.get_y() + bar.get_height()/2
-    ax.text(x_pos, y_pos, f"{duration_mins} mins", va='center', color='white', fontsize=10, zorder=4)
-
-# --- 5. ตั้งค่าแกน ---
-# แกน X: เวลา
-ax.set_xlim(18, 30.5)
-x_ticks = [18, 19, 20, 21, 22, 23, 24, 25, 26, 27, 28, 29, 30]
-x_labels = ['18:00', '19:00', '20:00', '21:00', '22:00', '23:00', '00:00', '01:00', '02:00', '03:00', '04:00', '05:00', '06:00']
-ax.set_xticks(x_ticks)
-ax.set_xticklabels(x_labels, fontsize=12, fontweight='bold', color='white')
-ax.set_xlabel('Milkyway', fontsize=14, color='#FFD700', labelpad=10)
-ax.xaxis.tick_top()
-ax.xaxis.set_label_position('top')
-
-# แกน Y: แสดงวันที่ (Map จาก index กลับเป็นชื่อวัน)
-date_labels = [d.strftime('%d %b') for d in df['Night_Date']]
-ax.set_yticks(y_positions)
-ax.set_yticklabels(date_labels, fontsize=11, color='#DDDDDD')
-ax.set_ylim(-0.5, len(df) - 0.5)
-ax.invert_yaxis() # เรียงจากบนลงล่าง
-
-# ขีดเส้นแบ่งระหว่างเดือน (Optional: เพื่อให้ดูง่ายขึ้นเมื่อวันที่กระโดด)
-for i in range(len(df) - 1):
-    curr_month = df['Night_Date'].iloc[i].month
-    next_month = df['Night_Date'].iloc[i+1].month
-    if curr_month != next_month:
-        # วาดเส้นคั่นเมื่อเปลี่ยนเดือน
-        ax.axhline(y=i + 0.5, color='white', linestyle='--', alpha=0.5, linewidth=1, zorder=2)
-
-# เส้น Grid แนวตั้ง
-ax.grid(axis='x', linestyle='--', alpha=0.3, color='white', zorder=1)
-ax.axvline(x=24, color='#00BFFF', linestyle='-', alpha=0.8, linewidth=2, zorder=2)
-
-# --- 6. ใส่รูปภาพพื้นหลัง ---
-try:
-    img = mpimg.imread(bg_image_path)
-    # Extent ต้องปรับตามแกน Y ใหม่ (0 ถึง len(df))
-    # y_min = len(df) - 0.5 (ล่างสุด เพราะ invert), y_max = -0.5 (บนสุด)
-    ax.imshow(img, extent=[18, 30.5, len(df)-0.5, -0.5], aspect='auto', zorder=0, alpha=0.5)
-except FileNotFoundError:
-    print(f"Warning: Image file '{bg_image_path}' not found. Using dark background.")
-    ax.set_facecolor("#1a1a2e")
-
-plt.tight_layout()
-output_file = 'milkyway_.png'
-plt.savefig(output_file, dpi=150, bbox_inches='tight')
-print(f"Graph saved to {output_file}")
-plt.show()
\ No newline at end of file
+@profiled()
+def render_chart(df, output_file, background=None, label='Milkyway', pyplot=False):
+    with plt.style.context('dark_background'):
+        # คำนวณความสูงรูปกราฟ (High Resolution Height)
+        row_height = 0.4 # ความสูงต่อ 1 แถวข้อมูล (นิ้ว)
+        fig_height = max(8, len(df) * row_height) 
+        # pyplot = True สร้างผ่าน pyplot (เปิดหน้าต่างด้วย plt.show() ได้) ไม่อย่างนั้นใช้ Figure ตรงๆ ไม่ผ่าน GUI backend
+        fig = plt.figure(figsize=(15, fig_height)) if pyplot else Figure(figsize=(15, fig_height))
+        ax = fig.subplots()
+
+        # ** หัวใจสำคัญ: ใช้ index (0, 1, 2...) เป็นแกน Y แทนวันที่จริง **
+        # เพื่อให้กราฟเรียงติดกันโดยไม่มีช่องว่างของวันที่หายไป
+        y_positions = np.arange(len(df))
+        left = df['Start_Val'].to_numpy()
+        right = df['End_Val'].to_numpy()
+
+        # วาดกราฟแท่งทั้งหมดเป็น collection เดียว (สี่เหลี่ยมสูง 0.6 ต่อแถว)
+        top, bottom = y_positions - 0.3, y_positions + 0.3
+        verts = np.stack([np.column_stack([left, top]), np.column_stack([left, bottom]),
+                          np.column_stack([right, bottom]), np.column_stack([right, top])], axis=1)
+        ax.add_collection(PolyCollection(verts, facecolors='#FFCC80', edgecolors='white',
+                                         alpha=0.9, zorder=3), autolim=False)
+
+        # ใส่ข้อความกำกับเวลาท้ายแท่ง
+        duration_mins = np.round(df['Duration'].to_numpy() * 60).astype(int)
+        for y, x, mins in zip(y_positions, right + 0.1, duration_mins):
+            ax.text(x, y, f"{mins} mins", va='center', color='white', fontsize=10, zorder=4)
+
+        # --- 5. ตั้งค่าแกน ---
+        # แกน X: เวลา
+        ax.set_xlim(18, 30.5)
+        x_ticks = [18, 19, 20, 21, 22, 23, 24, 25, 26, 27, 28, 29, 30]
+        x_labels = ['18:00', '19:00', '20:00', '21:00', '22:00', '23:00', '00:00', '01:00', '02:00', '03:00', '04:00', '05:00', '06:00']
+        ax.set_xticks(x_ticks)
+        ax.set_xticklabels(x_labels, fontsize=12, fontweight='bold', color='white')
+        ax.set_xlabel(label, fontsize=14, color='#FFD700', labelpad=10)
+        ax.xaxis.tick_top()
+        ax.xaxis.set_label_position('top')
+
+        # แกน Y: แสดงวันที่ (Map จาก index กลับเป็นชื่อวัน)
+        date_labels = df['Night_Date'].dt.strftime('%d %b').tolist()
+        ax.set_yticks(y_positions)
+        ax.set_yticklabels(date_labels, fontsize=11, color='#DDDDDD')
+        ax.set_ylim(-0.5, len(df) - 0.5)
+        ax.invert_yaxis() # เรียงจากบนลงล่าง
+
+        # ขีดเส้นแบ่งระหว่างเดือน (เพื่อให้ดูง่ายขึ้นเมื่อวันที่กระโดด) วาดทุกเส้นในครั้งเดียว
+        months = df['Night_Date'].dt.month.to_numpy()
+        month_changes = np.flatnonzero(months[:-1] != months[1:]) + 0.5
+        ax.hlines(month_changes, 18, 30.5, colors='white', linestyles='--', alpha=0.5, linewidth=1, zorder=2)
+
+        # เส้น Grid แนวตั้ง
+        ax.grid(axis='x', linestyle='--', alpha=0.3, color='white', zorder=1)
+        ax.axvline(x=24, color='#00BFFF', linestyle='-', alpha=0.8, linewidth=2, zorder=2)
+
+        # --- 6. ใส่รูปภาพพื้นหลัง ---
+        if background is not None:
+            # Extent ต้องปรับตามแกน Y ใหม่ (0 ถึง len(df))
+            # y_min = len(df) - 0.5 (ล่างสุด เพราะ invert), y_max = -0.5 (บนสุด)
+            ax.imshow(background, extent=[18, 30.5, len(df)-0.5, -0.5], aspect='auto', zorder=0, alpha=0.5)
+        else:
+            ax.set_facecolor("#1a1a2e")
+
+        fig.tight_layout()
+        with stage('savefig'):
+            fig.savefig(output_file, dpi=150, bbox_inches='tight')
+    return output_file
+
+# รูปพื้นหลังของแต่ละ worker process (อ่านครั้งเดียวตอนเริ่ม worker)
+_worker_background = None
+
+def _init_worker(background):
+    global _worker_background
+    _worker_background = background
+
+def _render_job(job):
+    name, df, path = job
+    return render_chart(df, path, _worker_background, label=f"Milkyway - {name}")
+
+def render_batch(df, by, output_dir=batch_output_dir, background=None, workers=batch_workers):
+    # สร้างกราฟหลายรูปพร้อมกันใน process pool (ไม่เปิดหน้าต่าง) คืนรายการไฟล์ที่สร้าง
+    os.makedirs(output_dir, exist_ok=True)
+    jobs = []
+    used = set()
+    for name, group in split_frame(df, by).items():
+        # ชื่อสถานที่อาจมี / หรือ : ซึ่งใช้เป็นชื่อไฟล์ไม่ได้ (ชื่อที่แปลงแล้วซ้ำกันจะต่อท้ายด้วยลำดับ)
+        # แทนเฉพาะตัวอักษรต้องห้าม ไม่ใช้ \w เพราะสระ/วรรณยุกต์ภาษาไทยไม่นับเป็น \w
+        stem = base = "milkyway_" + re.sub(r'[\\/:*?"<>|\s]+', '_', name)
+        suffix = 1
+        while stem in used:
+            suffix += 1
+            stem = f"{base}_{suffix}"
+        used.add(stem)
+        jobs.append((name, group, os.path.join(output_dir, f"{stem}.png")))
+    if len(jobs) < 2 or workers == 1:
+        _init_worker(background)
+        return [_render_job(job) for job in jobs]
+
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(background,)) as pool:
+        return list(pool.map(_render_job, jobs))
+
+if __name__ == "__main__":
+    if data_file:
+        with stage('read_records'):
+            data = [r for r in read_records(data_file) if site_name is None or r.get('Site') == site_name]
+
+    if not data:
+        # ไฟล์ว่าง หรือ site_name ไม่ตรงกับสถานที่ใดในไฟล์
+        print(f"ไม่พบข้อมูลช่วงถ่ายทางช้างเผือก{f' ของสถานที่ {site_name}' if data_file and site_name else ''}")
+    else:
+        df = prepare_frame(data)
+        background = load_background(bg_image_path)
+
+        if batch_by:
+            with stage('render_batch'):
+                files = render_batch(df, batch_by, batch_output_dir, background, batch_workers)
+            print(f"Saved {len(files)} graphs to {batch_output_dir}")
+        else:
+            render_chart(df, output_file, background, pyplot=show_window)
+            print(f"Graph saved to {output_file}")
+            if show_window:
+                plt.show()
@@ -1,23 +1,277 @@
-from skyfield.api import load, Topos, Star
+from skyfield.api import Topos, Star
 from skyfield import almanac
-from datetime import datetime, timedelta
+from skyfield.nutationlib import iau2000b_radians
+from datetime import datetime, timedelta, date
+import numpy as np
 import pytz
+import os
+
+from _milkyway_state_cache import cache_key, cached_arrays, ephemeris_id
+from _milkyway_output import write_records
+from _stargazing_profile import stage
+from _stargazing_ephemeris import ephemeris, timescale
+from _stargazing_fixed_star import fixed_star_altitudes, fixed_star_crossings, SIDEREAL_HOURS_PER_DAY
+import _stargazing_fixed_star as fixed_star
 
 # =================ตั้งค่าพิกัดและปีที่นี่=================
 # พิกัดตัวอย่าง: ยอดดอยอินทนนท์ (เปลี่ยนเป็นที่ที่คุณต้องการ)
 LATITUDE = 14.4390
 LONGITUDE = 101.3725
 YEAR = 2026
+# ปีสุดท้าย (มากกว่า YEAR = คำนวณต่อเนื่องหลายปี ส่งผลออกทีละปีโดยไม่เก็บไว้ทั้งหมด)
+END_YEAR = YEAR
 
 # ตั้งค่า Timezone เป็นประเทศไทย
 TZ = pytz.timezone('Asia/Bangkok')
 
 # มุมสูงขั้นต่ำของทางช้างเผือกที่จะเริ่มถ่าย (องศา)
 MIN_MW_ALTITUDE = 10.0 
+
+# เกณฑ์ท้องฟ้ามืดสนิท (มุมสูงดวงอาทิตย์) และเฟสดวงจันทร์สูงสุดที่ยอมให้อยู่เหนือขอบฟ้าได้
+DARK_SUN_ALTITUDE = -18.0
+MAX_MOON_PHASE = 0.2
+
+# โหมดการคำนวณ
+# 'vectorized' = คำนวณทั้งปี (365/366 คืน x 72 step) ในครั้งเดียว เร็วกว่ามาก
+# 'daily'      = วนคำนวณทีละคืนแบบเดิม
+ENGINE = 'vectorized'
+
+# ปรับขอบเวลา Start/End ให้ละเอียดระดับวินาที (เฉพาะโหมด vectorized)
+# สแกนหยาบทุก 10 นาทีก่อน แล้วใช้ bisection หาจุดเปลี่ยนเฉพาะรอบๆ ขอบของแต่ละคืน
+REFINE_EDGES = True
+REFINE_TOLERANCE_SECONDS = 1.0
+
+# วิธีคำนวณมุมสูงใจกลางทางช้างเผือก (RA/Dec คงที่) ในโหมด vectorized
+# 'analytic' = hour angle จากเวลาดาราคติ + RA/Dec ปรากฏวันละครั้ง (_stargazing_fixed_star.py) ต่างจากแบบเดิมไม่ถึง 1"
+# 'observe'  = observe().apparent().altaz() ทุก step แบบเดิม
+GALACTIC_CENTER_ENGINE = 'analytic'
+
+# เก็บมุมสูง/เฟสดวงจันทร์ที่คำนวณแล้วไว้ใน cache บนดิสก์ (ดู _milkyway_state_cache.py)
+# รันซ้ำหรือเปลี่ยน MIN_MW_ALTITUDE จะไม่ต้องคำนวณ ephemeris ของการสแกนหยาบใหม่
+USE_STATE_CACHE = True
+
+# บันทึกผลลงไฟล์ระหว่างคำนวณ (.jsonl / .csv / .ics) ให้ _milkyway_create_calendar_by_data_set.py อ่านต่อได้เลย
+# None = พิมพ์ data = [...] ออกหน้าจอแบบเดิม
+OUTPUT_FILENAME = None
 # ====================================================
 
+# ช่วงเวลาที่เช็คในแต่ละคืน: 18:00 ถึง 06:00 ทุกๆ 10 นาที
+STEP_MINUTES = 10
+NIGHT_HOURS = 12
+
+# กำหนดพิกัดใจกลางทางช้างเผือก (Galactic Center - Sagittarius A*)
+# RA: 17h 45m 40s | Dec: -29° 00' 28"
+GALACTIC_CENTER = Star(ra_hours=(17, 45, 40), dec_degrees=(-29, 0, 28))
+
+def days_in_year(year):
+    # จำนวนคืนของปี (ปีอธิกสุรทิน 366 คืน ไม่อย่างนั้นคืน 31 ธ.ค. จะหายไป)
+    return (date(year + 1, 1, 1) - date(year, 1, 1)).days
+
+def build_year_grid(ts, year, days=None):
+    # สร้างตารางเวลา (คืน x step) ทั้งปีในครั้งเดียว (days = None ใช้ทุกคืนของปี)
+    days = days_in_year(year) if days is None else days
+    # เวลาเริ่มเช็คคืนแรกคือ 18:00 แล้วเลื่อนไปทีละวัน/ทีละ step เป็นนาที
+    start_date = datetime(year, 1, 1, 12, 0, 0, tzinfo=TZ)
+    check_start = start_date.replace(hour=18, minute=0, second=0)
+    minutes, t = build_night_grid(ts, check_start, days)
+    return check_start, minutes, t
+
+def build_night_grid(ts, check_start, nights, step_minutes=STEP_MINUTES):
+    # ตารางเวลา (คืน x step) จำนวน nights คืน เริ่มจาก check_start คืน (นาทีนับจาก check_start, Time)
+    steps = NIGHT_HOURS * 60 // step_minutes
+    minutes = np.arange(nights)[:, None] * 1440 + np.arange(steps)[None, :] * step_minutes
+
+    # แปลงเป็น Time ของ Skyfield ทีเดียว (ts.utc รองรับนาทีที่เกิน 59)
+    t0 = check_start.astimezone(pytz.utc)
+    t = ts.utc(t0.year, t0.month, t0.day, t0.hour, t0.minute + minutes.ravel(), t0.second)
+
+    # ใช้ nutation แบบ IAU2000B (คลาดเคลื่อน ~1 milliarcsec) แทน IAU2000A ที่ใช้เวลาส่วนใหญ่ของการคำนวณ
+    t._nutation_angles_radians = iau2000b_radians(t)
+    return minutes, t
+
+def galactic_center_settings():
+    # ตั้งค่าที่มีผลกับมุมสูงใจกลางทางช้างเผือก ใส่ใน key ของ cache/ฐานข้อมูล (เปลี่ยนแล้วคำนวณใหม่)
+    # อ่านค่าตอนเรียก เพราะแก้ CORRECTION/APPARENT_STEP_DAYS ใน _stargazing_fixed_star.py จากภายนอกได้
+    if GALACTIC_CENTER_ENGINE != 'analytic':
+        return {'engine': GALACTIC_CENTER_ENGINE}
+    return {'engine': GALACTIC_CENTER_ENGINE, 'correction': fixed_star.CORRECTION,
+            'apparent_step_days': fixed_star.APPARENT_STEP_DAYS}
+
+def galactic_center_altitudes(eph, observer, t, latitude, longitude):
+    if GALACTIC_CENTER_ENGINE == 'analytic':
+        return fixed_star_altitudes(GALACTIC_CENTER, t, latitude, longitude, eph['earth'])
+    return observer.observe(GALACTIC_CENTER).apparent().altaz()[0].degrees
+
+def compute_altitudes(eph, location, t, latitude=LATITUDE, longitude=LONGITUDE):
+    # คำนวณมุมสูงดวงอาทิตย์ ใจกลางทางช้างเผือก ดวงจันทร์ และเฟสดวงจันทร์ ของทุกเวลาใน t
+    with stage('observer_position'):
+        observer = location.at(t)
+    with stage('sun_altaz'):
+        sun_alt = observer.observe(eph['sun']).apparent().altaz()[0].degrees
+    with stage('galactic_center_altaz'):
+        mw_alt = galactic_center_altitudes(eph, observer, t, latitude, longitude)
+    with stage('moon_altaz'):
+        moon_alt = observer.observe(eph['moon']).apparent().altaz()[0].degrees
+    with stage('moon_phase'):
+        moon_phase = almanac.fraction_illuminated(eph, 'moon', t)
+    return sun_alt, mw_alt, moon_alt, moon_phase
+
+def grid_cache_key(eph, year, kind, **site):
+    # key ของ array ที่คำนวณบนตารางเวลาของทั้งปี (ขึ้นกับ ephemeris, ปี, step และสถานที่)
+    return cache_key(kind=kind, ephemeris=ephemeris_id(eph), year=year, days=days_in_year(year),
+                     step_minutes=STEP_MINUTES, night_hours=NIGHT_HOURS, tz=str(TZ),
+                     galactic_center=galactic_center_settings(), **site)
+
+def visibility_mask(sun_alt, mw_alt, moon_alt, moon_phase, min_mw_altitude=MIN_MW_ALTITUDE):
+    # มืดสนิท (Alt < -18) + ทางช้างเผือกสูงกว่ากำหนด + ดวงจันทร์ตกหรือสว่างน้อยกว่า 20%
+    is_dark = sun_alt < DARK_SUN_ALTITUDE
+    is_mw_up = mw_alt > min_mw_altitude
+    is_moon_ok = (moon_alt < 0) | (moon_phase < MAX_MOON_PHASE)
+    return is_dark & is_mw_up & is_moon_ok
+
+def window_edges(mask):
+    # หา index แรก/สุดท้ายที่ถ่ายได้ของทุกคืนพร้อมกัน (ไม่ต้องวนทีละวัน)
+    nights = np.flatnonzero(mask.any(axis=1))
+    first_idx = mask[nights].argmax(axis=1)
+    last_idx = mask.shape[1] - 1 - mask[nights, ::-1].argmax(axis=1)
+    return nights, first_idx, last_idx
+
+def bisect_transitions(visible_at, lo_tt, hi_tt, lo_state,
+                       tolerance_seconds=REFINE_TOLERANCE_SECONDS):
+    # Bisection พร้อมกันทุกช่วง: แต่ละช่วง [lo, hi] มีสถานะ visible ต่างกันที่ปลายทั้งสอง
+    # visible_at รับ array ของเวลา TT (Julian date) ทุกรอบจึงคำนวณจุดกึ่งกลางของทุกช่วงใน call เดียว
+    lo = np.array(lo_tt, dtype=float)
+    hi = np.array(hi_tt, dtype=float)
+    while len(lo) and (hi - lo).max() * 86400 > tolerance_seconds:
+        mid = (lo + hi) / 2
+        same = visible_at(mid) == lo_state
+        lo = np.where(same, mid, lo)
+        hi = np.where(same, hi, mid)
+    return lo, hi
+
+def refine_window_edges(visible_at, tt_grid, nights, first_idx, last_idx):
+    # ขอบเริ่ม: step ก่อนหน้ายังถ่ายไม่ได้ -> step แรกที่ถ่ายได้
+    # ขอบจบ: step สุดท้ายที่ถ่ายได้ -> step ถัดไปที่ถ่ายไม่ได้
+    # ถ้าขอบชนช่วงเช็ค (18:00 หรือ 05:50) จะใช้เวลาเดิมจากการสแกนหยาบ
+    start_tt = tt_grid[nights, first_idx]
+    end_tt = tt_grid[nights, last_idx]
+    has_before = first_idx > 0
+    has_after = last_idx < tt_grid.shape[1] - 1
+
+    lo = np.concatenate([tt_grid[nights[has_before], first_idx[has_before] - 1], end_tt[has_after]])
+    hi = np.concatenate([start_tt[has_before], tt_grid[nights[has_after], last_idx[has_after] + 1]])
+    lo_state = np.concatenate([np.zeros(has_before.sum(), bool), np.ones(has_after.sum(), bool)])
+    lo, hi = bisect_transitions(visible_at, lo, hi, lo_state)
+
+    n_start = has_before.sum()
+    start_tt = start_tt.copy()
+    end_tt = end_tt.copy()
+    start_tt[has_before] = hi[:n_start]
+    end_tt[has_after] = lo[n_start:]
+    return start_tt, end_tt
+
+def format_windows(check_start, nights, start_minutes, end_minutes):
+    # start_minutes/end_minutes = นาที (ทศนิยมได้) นับจาก 18:00 ของคืนแรก
+    # ปัดเวลาเริ่มขึ้น และเวลาจบลง เพื่อให้ช่วงที่แสดงอยู่ในช่วงที่ถ่ายได้จริง
+    start_shown = np.ceil(np.asarray(start_minutes) - 1e-6).astype(int)
+    end_shown = np.floor(np.asarray(end_minutes) + 1e-6).astype(int)
+
+    # ถ้าช่วงเวลาน้อยกว่า 20 นาที ไม่นับ (ถ่ายไม่ทัน) ตรวจจากเวลาที่แสดงหลังปัดแล้ว แบบเดียวกับโหมด daily
+    keep = (end_shown - start_shown) * 60 > 1200
+
+    results = []
+    for day, s_min, e_min in zip(nights[keep], start_shown[keep], end_shown[keep]):
+        s_time = check_start + timedelta(minutes=int(s_min))
+        e_time = check_start + timedelta(minutes=int(e_min))
+        results.append({
+            "Date": s_time.strftime("%Y-%m-%d"),
+            "Start": s_time.strftime("%H:%M"),
+            "End": e_time.strftime("%H:%M"),
+        })
+    return results
+
+def milkyway_windows_year(eph, ts, latitude=LATITUDE, longitude=LONGITUDE, year=YEAR,
+                          min_mw_altitude=MIN_MW_ALTITUDE, refine=REFINE_EDGES, use_cache=USE_STATE_CACHE):
+    # คำนวณทั้งปีใน Skyfield/NumPy pass เดียว แล้ว reshape เป็น (คืน x step)
+    location = eph['earth'] + Topos(latitude_degrees=latitude, longitude_degrees=longitude)
+    with stage('time_grid'):
+        check_start, minutes, t = build_year_grid(ts, year)
+
+    def compute():
+        names = ('sun_alt', 'mw_alt', 'moon_alt', 'moon_phase')
+        return dict(zip(names, compute_altitudes(eph, location, t, latitude, longitude)))
+
+    if use_cache:
+        key = grid_cache_key(eph, year, 'site_altitudes', latitude=latitude, longitude=longitude)
+        with stage('state_cache'):
+            altitudes = cached_arrays(key, compute)
+    else:
+        altitudes = compute()
+
+    def visible_at(t):
+        return visibility_mask(*compute_altitudes(eph, location, t, latitude, longitude),
+                               min_mw_altitude=min_mw_altitude)
+
+    def visible_at_tt(tt):
+        t = ts.tt_jd(tt)
+        t._nutation_angles_radians = iau2000b_radians(t)
+        return visible_at(t)
+
+    mask = visibility_mask(altitudes['sun_alt'], altitudes['mw_alt'], altitudes['moon_alt'],
+                           altitudes['moon_phase'], min_mw_altitude=min_mw_altitude).reshape(minutes.shape)
+    tt_grid = t.tt.reshape(minutes.shape)
+    return mask_to_windows(mask, check_start, minutes, tt_grid, visible_at_tt if refine else None)
+
+def galactic_center_rise_set(eph, ts, latitude=LATITUDE, longitude=LONGITUDE, year=YEAR,
+                             min_mw_altitude=MIN_MW_ALTITUDE):
+    # เวลาที่ใจกลางทางช้างเผือกขึ้นพ้น / ตกต่ำกว่า min_mw_altitude ของทุกคืน (แก้สมการตรงๆ ไม่สแกน)
+    # set = ครั้งแรกหลัง 18:00, rise = ครั้งล่าสุดก่อน set (ก่อน 18:00 ได้ถ้าคืนนั้นขึ้นมาก่อนแล้ว)
+    # คืน (วันที่ของคืน, rise, set) โดย rise/set เป็น datetime ตาม TZ (None = คืนนั้นไม่ผ่านมุมสูงนี้)
+    check_start, minutes, t = build_year_grid(ts, year)
+    nights = t[::minutes.shape[1]]
+    rise_tt, set_tt = fixed_star_crossings(GALACTIC_CENTER, nights, latitude, longitude, min_mw_altitude, eph['earth'])
+
+    # คืนที่ตอน 18:00 ใจกลางทางช้างเผือกอยู่สูงกว่า min_mw_altitude แล้ว จะตกก่อนขึ้น (rise ที่ได้เป็นของเย็นวันถัดไป)
+    # ใช้เวลาขึ้นครั้งก่อนหน้าแทน (ย้อนไป 1 วันดาราคติ) ให้ rise < 18:00 < set ของคืนเดียวกัน
+    already_up = set_tt < rise_tt
+    rise_tt = np.where(already_up, rise_tt - 24.0 / SIDEREAL_HOURS_PER_DAY, rise_tt)
+    if np.any(rise_tt >= set_tt):
+        raise ValueError("เวลาขึ้นของใจกลางทางช้างเผือกต้องมาก่อนเวลาตกในคืนเดียวกัน")
+
+    def local(tt):
+        return None if np.isnan(tt) else ts.tt_jd(tt).utc_datetime().astimezone(TZ)
+
+    for night, (r_tt, s_tt) in enumerate(zip(rise_tt, set_tt)):
+        yield (check_start + timedelta(days=night)).date(), local(r_tt), local(s_tt)
+
+def iter_milkyway_windows(eph, ts, latitude=LATITUDE, longitude=LONGITUDE, years=(YEAR,),
+                          min_mw_altitude=MIN_MW_ALTITUDE, refine=REFINE_EDGES, use_cache=USE_STATE_CACHE):
+    # ส่งรายการ {"Date", "Start", "End"} ออกทีละคืน คำนวณทีละปี (หน่วยความจำคงที่ไม่ว่าจะกี่ปี)
+    # แต่ละปีครบทุกคืนถึง 31 ธ.ค. (ปีอธิกสุรทิน 366 คืน) ต่อกันได้โดยไม่มีวันขาด
+    for year in years:
+        yield from milkyway_windows_year(eph, ts, latitude, longitude, year, min_mw_altitude, refine, use_cache)
+
+def mask_to_windows(mask, check_start, minutes, tt_grid, visible_at_tt=None):
+    # แปลง mask (คืน x step) เป็นรายการช่วงเวลา ถ้าส่ง visible_at_tt มาจะปรับขอบด้วย bisection
+    with stage('window_edges'):
+        nights, first_idx, last_idx = window_edges(mask)
+    start_minutes = minutes[nights, first_idx].astype(float)
+    end_minutes = minutes[nights, last_idx].astype(float)
+
+    if visible_at_tt is not None:
+        with stage('refine_edges'):
+            start_tt, end_tt = refine_window_edges(visible_at_tt, tt_grid, nights, first_idx, last_idx)
+        night_tt = tt_grid[nights, 0]
+        start_minutes = minutes[nights, 0] + (start_tt - night_tt) * 1440
+        end_minutes = minutes[nights, 0] + (end_tt - night_tt) * 1440
+
+    with stage('format_windows'):
+        return format_windows(check_start, nights, start_minutes, end_minutes)
+
 def calculate_milkyway_window():
-    print(f"กำลังคำนวณข้อมูลปี {YEAR} สำหรับพิกัด {LATITUDE}, {LONGITUDE}...")
+    years = range(YEAR, END_YEAR + 1)
+    year_text = f"{YEAR}" if END_YEAR == YEAR else f"{YEAR}-{END_YEAR}"
+    print(f"กำลังคำนวณข้อมูลปี {year_text} สำหรับพิกัด {LATITUDE}, {LONGITUDE}...")
     print("กรุณารอสักครู่ (อาจใช้เวลา 10-20 วินาที)...")
 
     # โหลดข้อมูลดาราศาสตร์
@@ -26,7 +280,30 @@ def calculate_milkyway_window():
     # de440.bsp (113 MB): ไฟล์เต็มของ de440 ครอบคลุมยาวนานมาก (ค.ศ. 1550-2650) ใช้สำหรับงานวิจัยประวัติศาสตร์หรืออนาคตไกลๆ
     # de422.bsp (623 MB): ไฟล์ยักษ์ ครอบคลุมยุคไดโนเสาร์ถึงอนาคต (3000 BC - 3000 AD) นานๆ จะมีคนใช้ทีครับ
 
-    eph = load('de440s.bsp')
+    # ตัดไฟล์เหลือเฉพาะปีที่คำนวณ (ดู _stargazing_ephemeris.py)
+    with stage('ephemeris_load'):
+        eph = ephemeris('de440s.bsp', years)
+        ts = timescale()
+
+    if ENGINE == 'vectorized':
+        results = iter_milkyway_windows(eph, ts, years=years)
+    else:
+        results = (r for year in years for r in calculate_milkyway_window_daily(eph, ts, year))
+
+    if OUTPUT_FILENAME:
+        with stage('stream_output'):
+            count = write_records(results, OUTPUT_FILENAME, latitude=LATITUDE, longitude=LONGITUDE)
+        print(f"\nบันทึก {count} คืนสำเร็จ: {os.path.abspath(OUTPUT_FILENAME)}")
+        return
+
+    # พิมพ์ผลลัพธ์ (ทีละคืนระหว่างคำนวณ)
+    print("\ndata = [")
+    with stage('stream_output'):
+        for r in results:
+            print(f'    {{"Date": "{r["Date"]}", "Start": "{r["Start"]}", "End": "{r["End"]}"}},')
+    print("]")
+
+def calculate_milkyway_window_daily(eph, ts, year=YEAR):
     sun = eph['sun']
     moon = eph['moon']
     earth = eph['earth']
@@ -34,17 +311,12 @@ def calculate_milkyway_window():
     # กำหนดพิกัดสถานที่
     location = earth + Topos(latitude_degrees=LATITUDE, longitude_degrees=LONGITUDE)
     
-    # กำหนดพิกัดใจกลางทางช้างเผือก (Galactic Center - Sagittarius A*)
-    # RA: 17h 45m 40s | Dec: -29° 00' 28"
-    galactic_center = Star(ra_hours=(17, 45, 40), dec_degrees=(-29, 0, 28))
+    galactic_center = GALACTIC_CENTER
 
-    results = []
-    
-    # เริ่มลูปตั้งแต่วันที่ 1 ม.ค. ถึง 31 ธ.ค.
-    start_date = datetime(YEAR, 1, 1, 12, 0, 0, tzinfo=TZ) # เริ่มเที่ยงวัน
-    ts = load.timescale()
+    # เริ่มลูปตั้งแต่วันที่ 1 ม.ค. ถึง 31 ธ.ค. (ส่งผลออกทีละคืนแบบ generator)
+    start_date = datetime(year, 1, 1, 12, 0, 0, tzinfo=TZ) # เริ่มเที่ยงวัน
 
-    for day in range(365):
+    for day in range(days_in_year(year)):
         current_date = start_date + timedelta(days=day)
         
         # เราจะเช็คช่วงเวลาตั้งแต่ 18:00 (เย็น) ถึง 06:00 (เช้าวันถัดไป)
@@ -60,30 +332,35 @@ def calculate_milkyway_window():
         temp_time = check_start
         while temp_time < check_end:
             time_steps.append(temp_time)
-            temp_time += timedelta(minutes=10)
+            temp_time += timedelta(minutes=STEP_MINUTES)
 
         # แปลงเวลาทั้งหมดเป็น Time Object ของ Skyfield ทีเดียว (เร็วกว่า loop)
         t_list = ts.from_datetimes(time_steps)
         
         # คำนวณตำแหน่งดวงดาวทั้งหมดทีเดียว (Vectorized operation)
-        observer = location.at(t_list)
+        with stage('observer_position'):
+            observer = location.at(t_list)
         
         # 1. เช็คดวงอาทิตย์ (ต้องมืดสนิท Alt < -18)
-        sun_alt = observer.observe(sun).apparent().altaz()[0].degrees
-        is_dark = sun_alt < -18
+        with stage('sun_altaz'):
+            sun_alt = observer.observe(sun).apparent().altaz()[0].degrees
+        is_dark = sun_alt < DARK_SUN_ALTITUDE
 
         # 2. เช็คทางช้างเผือก (ต้องสูงกว่ากำหนด)
-        mw_alt = observer.observe(galactic_center).apparent().altaz()[0].degrees
+        with stage('galactic_center_altaz'):
+            mw_alt = observer.observe(galactic_center).apparent().altaz()[0].degrees
         is_mw_up = mw_alt > MIN_MW_ALTITUDE
 
         # 3. เช็คดวงจันทร์ (ต้องอยู่ต่ำกว่าขอบฟ้า หรือ เฟสบางมากๆ)
-        moon_app = observer.observe(moon).apparent()
-        moon_alt = moon_app.altaz()[0].degrees
+        with stage('moon_altaz'):
+            moon_app = observer.observe(moon).apparent()
+            moon_alt = moon_app.altaz()[0].degrees
         # คำนวณเฟสของดวงจันทร์ (0.0 - 1.0)
-        moon_phase = almanac.fraction_illuminated(eph, 'moon', t_list)
+        with stage('moon_phase'):
+            moon_phase = almanac.fraction_illuminated(eph, 'moon', t_list)
         
         # เงื่อนไข: ดวงจันทร์ตก (Alt < 0) หรือ สว่างน้อยกว่า 20%
-        is_moon_ok = (moon_alt < 0) | (moon_phase < 0.2)
+        is_moon_ok = (moon_alt < 0) | (moon_phase < MAX_MOON_PHASE)
 
         # รวมเงื่อนไข: มืด + ทางช้างเผือกขึ้น + ไม่มีดวงจันทร์กวน
         visible_mask = is_dark & is_mw_up & is_moon_ok
@@ -108,13 +385,7 @@ def calculate_milkyway_window():
                 start_str = s_time.strftime("%H:%M")
                 end_str = e_time.strftime("%H:%M")
                 
-                results.append(f'    {{"Date": "{date_str}", "Start": "{start_str}", "End": "{end_str}"}},')
-
-    # พิมพ์ผลลัพธ์
-    print("\ndata = [")
-    for line in results:
-        print(line)
-    print("]")
+                yield {"Date": date_str, "Start": start_str, "End": end_str}
 
 if __name__ == "__main__":
     calculate_milkyway_window()
\ No newline at end of file
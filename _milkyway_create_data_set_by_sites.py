@@ -0,0 +1,210 @@
+from skyfield.api import wgs84
+from skyfield import almanac
+from skyfield.framelib import true_equator_and_equinox_of_date
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+from collections import Counter
+import numpy as np
+import json
+import os
+
+import _milkyway_create_data_set as mw
+from _milkyway_create_data_set import (
+    YEAR, MIN_MW_ALTITUDE, REFINE_EDGES, USE_STATE_CACHE, GALACTIC_CENTER,
+    build_year_grid, grid_cache_key, visibility_mask, mask_to_windows,
+)
+from _milkyway_state_cache import cached_arrays
+from _milkyway_output import write_records
+from _stargazing_profile import stage
+from _stargazing_ephemeris import ephemeris, timescale
+from _stargazing_fixed_star import SIDEREAL_HOURS_PER_DAY, apparent_xyz
+
+# =================ตั้งค่ารายชื่อสถานที่และปีที่นี่=================
+# ทุกสถานที่ใช้ช่วงเวลาเช็ค 18:00-06:00 ตาม Timezone ใน _milkyway_create_data_set.py
+SITES = [
+    {"name": "Khao Yai", "latitude": 14.4390, "longitude": 101.3725},
+    {"name": "Doi Inthanon", "latitude": 18.5558, "longitude": 98.4822},
+]
+
+# จำนวน process ที่ใช้ (None = เท่ากับจำนวน core) และจำนวนสถานที่ขั้นต่ำที่จะเริ่มใช้ process pool
+WORKERS = None
+PARALLEL_MIN_SITES = 8
+
+# --- ตั้งค่า Output ---
+SAVE_JSON = True
+JSON_FILENAME = f"milkyway_sites_{YEAR}.json"
+
+# บันทึกทีละสถานที่ระหว่างคำนวณ (.jsonl / .csv / .ics) แทน JSON ก้อนเดียว (None = ไม่ใช้)
+OUTPUT_FILENAME = None
+# ====================================================
+
+def geocentric_state(eph, t):
+    # คำนวณส่วนที่ไม่ขึ้นกับสถานที่ครั้งเดียวต่อเวลา: ตำแหน่ง apparent จากใจกลางโลก
+    # ในกรอบ true equator of date (หน่วย AU) + GAST + เฟสดวงจันทร์
+    earth = eph['earth'].at(t)
+    state = {
+        'tt': t.tt,
+        'gast': t.gast,
+        'moon_phase': almanac.fraction_illuminated(eph, 'moon', t),
+    }
+    for name, target in (('sun', eph['sun']), ('moon', eph['moon'])):
+        position = earth.observe(target).apparent()
+        state[name] = position.frame_xyz(true_equator_and_equinox_of_date).au
+    if mw.GALACTIC_CENTER_ENGINE == 'analytic':
+        # RA/Dec ปรากฏวันละครั้งแล้ว interpolate แทน observe ทุก step (ดู _stargazing_fixed_star.py)
+        state['mw'] = apparent_xyz(GALACTIC_CENTER, t, eph['earth'])
+    else:
+        state['mw'] = earth.observe(GALACTIC_CENTER).apparent().frame_xyz(true_equator_and_equinox_of_date).au
+    return state
+
+def interpolate_state(state, tt):
+    # ประมาณค่า state ที่เวลาใดๆ ระหว่าง step ของตาราง (ใช้ตอนปรับขอบ ไม่ต้องคำนวณ ephemeris ซ้ำ)
+    # ภายใน 10 นาที ตำแหน่งดวงอาทิตย์/ดวงจันทร์เปลี่ยนเกือบเป็นเส้นตรง ส่วน GAST เพิ่มตามอัตราการหมุนโลก
+    idx = np.clip(np.searchsorted(state['tt'], tt, side='right') - 1, 0, len(state['tt']) - 2)
+    dt = tt - state['tt'][idx]
+    frac = dt / (state['tt'][idx + 1] - state['tt'][idx])
+    result = {
+        'tt': tt,
+        'gast': (state['gast'][idx] + dt * SIDEREAL_HOURS_PER_DAY) % 24.0,
+        'moon_phase': state['moon_phase'][idx] + frac * (state['moon_phase'][idx + 1] - state['moon_phase'][idx]),
+    }
+    for name in ('sun', 'moon', 'mw'):
+        xyz = state[name]
+        result[name] = xyz[:, idx] + frac * (xyz[:, idx + 1] - xyz[:, idx])
+    return result
+
+def site_altitudes(state, latitude, longitude):
+    # แปลงเป็นมุมสูงของสถานที่หนึ่ง: หมุนตำแหน่งผู้สังเกตตาม GAST แล้วหักออก (topocentric)
+    # จากนั้นหามุมเทียบกับแนวดิ่งของสถานที่ เป็นแค่ NumPy ไม่กี่บรรทัดต่อสถานที่
+    x, y, z = wgs84.latlon(latitude, longitude).itrs_xyz.au
+    lat = np.radians(latitude)
+    theta = np.radians(state['gast'] * 15.0 + longitude)
+    cos_theta = np.cos(theta)
+    sin_theta = np.sin(theta)
+
+    r_xy = np.hypot(x, y)
+    observer = np.array([r_xy * cos_theta, r_xy * sin_theta, np.full_like(theta, z)])
+    up = np.array([np.cos(lat) * cos_theta, np.cos(lat) * sin_theta, np.full_like(theta, np.sin(lat))])
+
+    altitudes = []
+    for name in ('sun', 'mw', 'moon'):
+        v = state[name] - observer
+        sin_alt = (v * up).sum(axis=0) / np.sqrt((v * v).sum(axis=0))
+        altitudes.append(np.degrees(np.arcsin(np.clip(sin_alt, -1.0, 1.0))))
+    sun_alt, mw_alt, moon_alt = altitudes
+    return sun_alt, mw_alt, moon_alt, state['moon_phase']
+
+def site_mask(state, minutes, site, min_mw_altitude=MIN_MW_ALTITUDE):
+    # mask (คืน x step) ของช่วงที่ถ่ายได้ของสถานที่เดียว
+    return visibility_mask(*site_altitudes(state, site['latitude'], site['longitude']),
+                           min_mw_altitude=min_mw_altitude).reshape(minutes.shape)
+
+def site_windows(state, check_start, minutes, site, min_mw_altitude=MIN_MW_ALTITUDE, refine=REFINE_EDGES,
+                 mask=None):
+    # ช่วงเวลาถ่ายทางช้างเผือกทั้งปีของสถานที่เดียว จาก state ที่คำนวณไว้แล้ว (ส่ง mask ที่คำนวณไว้แล้วมาได้)
+    latitude, longitude = site['latitude'], site['longitude']
+
+    def visible_at_tt(tt):
+        state_at = interpolate_state(state, tt)
+        return visibility_mask(*site_altitudes(state_at, latitude, longitude), min_mw_altitude=min_mw_altitude)
+
+    if mask is None:
+        mask = site_mask(state, minutes, site, min_mw_altitude)
+    tt_grid = state['tt'].reshape(minutes.shape)
+    return mask_to_windows(mask, check_start, minutes, tt_grid, visible_at_tt if refine else None)
+
+# state ของแต่ละ worker process (ส่งไปครั้งเดียวตอนเริ่ม worker ไม่ต้องส่งซ้ำทุกสถานที่)
+_worker_args = None
+
+def _init_worker(state, check_start, minutes):
+    global _worker_args
+    _worker_args = (state, check_start, minutes)
+
+def _site_job(site, min_mw_altitude, refine):
+    return site_windows(*_worker_args, site, min_mw_altitude=min_mw_altitude, refine=refine)
+
+def year_state(eph, ts, year, use_cache=USE_STATE_CACHE):
+    # state ไม่ขึ้นกับสถานที่ จึงใช้ cache ร่วมกันได้ทุกชุดสถานที่ของปีเดียวกัน
+    check_start, minutes, t = build_year_grid(ts, year)
+    with stage('geocentric_state'):
+        if use_cache:
+            state = cached_arrays(grid_cache_key(eph, year, 'geocentric_state'), lambda: geocentric_state(eph, t))
+        else:
+            state = geocentric_state(eph, t)
+    return state, check_start, minutes
+
+def iter_sites_windows(state, check_start, minutes, sites, min_mw_altitude=MIN_MW_ALTITUDE,
+                       refine=REFINE_EDGES, workers=WORKERS):
+    # ส่งรายการช่วงเวลาของแต่ละสถานที่ออกตามลำดับ ทันทีที่สถานที่นั้นคำนวณเสร็จ
+    # (ใช้ process pool เมื่อมีหลายสถานที่)
+    if len(sites) < PARALLEL_MIN_SITES or workers == 1:
+        for site in sites:
+            with stage('site_windows'):
+                windows = site_windows(state, check_start, minutes, site, min_mw_altitude, refine)
+            yield windows
+        return
+
+    workers = workers or os.cpu_count()
+    job = partial(_site_job, min_mw_altitude=min_mw_altitude, refine=refine)
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                             initargs=(state, check_start, minutes)) as pool:
+        yield from pool.map(job, sites, chunksize=max(1, len(sites) // (4 * workers)))
+
+def check_site_names(sites):
+    # ผลลัพธ์ใช้ชื่อสถานที่เป็น key ชื่อซ้ำจะทับกันเงียบๆ จึงไม่ยอมให้ซ้ำ
+    counts = Counter(site['name'] for site in sites)
+    duplicates = sorted(name for name, count in counts.items() if count > 1)
+    if duplicates:
+        raise ValueError(f"ชื่อสถานที่ซ้ำกัน: {', '.join(duplicates)}")
+
+def milkyway_windows_sites(eph, ts, sites, year=YEAR, min_mw_altitude=MIN_MW_ALTITUDE,
+                           refine=REFINE_EDGES, workers=WORKERS, use_cache=USE_STATE_CACHE):
+    # คำนวณ ephemeris ครั้งเดียว แล้วกระจายงานรายสถานที่
+    check_site_names(sites)
+    state, check_start, minutes = year_state(eph, ts, year, use_cache)
+    windows = iter_sites_windows(state, check_start, minutes, sites, min_mw_altitude, refine, workers)
+    return {site['name']: site_windows_list for site, site_windows_list in zip(sites, windows)}
+
+def iter_milkyway_windows_sites(eph, ts, sites, years=(YEAR,), min_mw_altitude=MIN_MW_ALTITUDE,
+                                refine=REFINE_EDGES, workers=WORKERS, use_cache=USE_STATE_CACHE):
+    # ส่งรายการทีละคืน {"Site", "Latitude", "Longitude", "Date", "Start", "End"} ทีละปี ทีละสถานที่
+    # ไม่เก็บผลทั้งหมดไว้ในหน่วยความจำ เหมาะกับหลายปี/หลายสถานที่
+    for year in years:
+        state, check_start, minutes = year_state(eph, ts, year, use_cache)
+        windows = iter_sites_windows(state, check_start, minutes, sites, min_mw_altitude, refine, workers)
+        for site, records in zip(sites, windows):
+            for r in records:
+                yield {"Site": site['name'], "Latitude": site['latitude'], "Longitude": site['longitude'], **r}
+
+def calculate_milkyway_window_sites():
+    print(f"กำลังคำนวณข้อมูลปี {YEAR} สำหรับ {len(SITES)} สถานที่...")
+
+    with stage('ephemeris_load'):
+        eph = ephemeris('de440s.bsp', (YEAR,))
+        ts = timescale()
+
+    if OUTPUT_FILENAME:
+        with stage('stream_output'):
+            count = write_records(iter_milkyway_windows_sites(eph, ts, SITES), OUTPUT_FILENAME)
+        print(f"\nบันทึก {count} รายการสำเร็จ: {os.path.abspath(OUTPUT_FILENAME)}")
+        return
+
+    results = milkyway_windows_sites(eph, ts, SITES)
+
+    for site in SITES:
+        print(f"\n# {site['name']} ({site['latitude']}, {site['longitude']})")
+        print("data = [")
+        for r in results[site['name']]:
+            print(f'    {{"Date": "{r["Date"]}", "Start": "{r["Start"]}", "End": "{r["End"]}"}},')
+        print("]")
+
+    if SAVE_JSON:
+        try:
+            with open(JSON_FILENAME, 'w', encoding='utf-8') as f:
+                json.dump(results, f, indent=4, ensure_ascii=False)
+            print(f"\nบันทึก JSON สำเร็จ: {os.path.abspath(JSON_FILENAME)}")
+        except Exception as e:
+            print(f"\nError Saving JSON: {e}")
+
+if __name__ == "__main__":
+    calculate_milkyway_window_sites()
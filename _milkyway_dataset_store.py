@@ -0,0 +1,197 @@
+from datetime import datetime
+import sqlite3
+import json
+import os
+
+import _milkyway_create_data_set as mw
+from _milkyway_create_data_set_by_sites import year_state, iter_sites_windows, check_site_names, SITES
+from _milkyway_state_cache import cache_key, ephemeris_id
+from _milkyway_output import write_records
+from _stargazing_profile import stage
+from _stargazing_ephemeris import ephemeris, timescale
+
+# =================ตั้งค่าฐานข้อมูลช่วงถ่ายทางช้างเผือก=================
+# เก็บผลทีละ (สถานที่, ปี) ลง SQLite คำนวณเฉพาะปีที่ยังไม่มี หรือที่พารามิเตอร์เปลี่ยน
+# (เช่นเปลี่ยน MIN_MW_ALTITUDE, DARK_SUN_ALTITUDE, MAX_MOON_PHASE, พิกัด หรือไฟล์ ephemeris)
+STORE_FILENAME = 'milkyway_windows.sqlite'
+START_YEAR = 2026
+END_YEAR = 2050
+
+# รายชื่อสถานที่ (ค่าเริ่มต้นใช้ SITES ของ _milkyway_create_data_set_by_sites.py)
+STORE_SITES = SITES
+
+# ถามช่วงวันที่ของสถานที่เดียวหลังอัปเดต (None = ไม่ถาม) และบันทึกผลลงไฟล์ (.jsonl / .csv / .ics)
+QUERY_SITE = None
+QUERY_START = '2026-01-01'
+QUERY_END = '2026-12-31'
+QUERY_OUTPUT_FILENAME = None
+# ====================================================
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS partitions (
+    site TEXT NOT NULL,
+    year INTEGER NOT NULL,
+    params_hash TEXT NOT NULL,
+    params TEXT NOT NULL,
+    latitude REAL NOT NULL,
+    longitude REAL NOT NULL,
+    window_count INTEGER NOT NULL,
+    computed_at TEXT NOT NULL,
+    PRIMARY KEY (site, params_hash, year)
+);
+-- Date เป็นวันที่เริ่มถ่าย ช่วงที่เริ่มหลังเที่ยงคืนของคืนสุดท้ายจึงอาจเป็นวันที่ของปีถัดไป
+-- key จึงรวม year ของ partition ด้วย บันทึก partition หนึ่งจะไม่ทับแถวของปีข้างเคียง
+CREATE TABLE IF NOT EXISTS windows (
+    site TEXT NOT NULL,
+    params_hash TEXT NOT NULL,
+    date TEXT NOT NULL,
+    start TEXT NOT NULL,
+    end TEXT NOT NULL,
+    year INTEGER NOT NULL,
+    PRIMARY KEY (site, params_hash, year, date, start)
+) WITHOUT ROWID;
+-- ถามช่วงวันที่ข้ามปีโดยไม่ต้องสแกนทุกปีของสถานที่และไม่ต้อง sort ใหม่
+CREATE INDEX IF NOT EXISTS windows_by_date ON windows (site, params_hash, date, start);
+"""
+
+# เพิ่มเมื่อ SCHEMA เปลี่ยน แล้วปรับไฟล์เก่าใน open_store
+# version 1: key ของ windows มี year, ปีอธิกสุรทิน 366 คืน (ไฟล์ก่อนหน้านี้ถูกล้างแล้วคำนวณใหม่)
+# version 2: partitions.nights เปลี่ยนชื่อเป็น window_count (เก็บจำนวนช่วงเวลา ไม่ใช่จำนวนคืน)
+SCHEMA_VERSION = 2
+
+def open_store(path=STORE_FILENAME):
+    conn = sqlite3.connect(path)
+    version = conn.execute("PRAGMA user_version").fetchone()[0]
+    if version < SCHEMA_VERSION:
+        with conn:
+            if version < 1:
+                conn.execute("DROP TABLE IF EXISTS windows")
+                conn.execute("DROP TABLE IF EXISTS partitions")
+            elif version < 2:
+                conn.execute("ALTER TABLE partitions RENAME COLUMN nights TO window_count")
+        conn.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
+    conn.executescript(SCHEMA)
+    return conn
+
+def site_params(eph, site, min_mw_altitude=None, refine=None):
+    # พารามิเตอร์ทั้งหมดที่มีผลกับผลลัพธ์ของสถานที่หนึ่ง คืน (hash, dict)
+    # ไม่ใส่ปี จึงใช้ hash เดียวกันทุกปี และถามข้ามปีได้จาก index เดียว
+    min_mw_altitude = mw.MIN_MW_ALTITUDE if min_mw_altitude is None else min_mw_altitude
+    refine = mw.REFINE_EDGES if refine is None else refine
+    return cache_key(
+        kind='sites_windows', ephemeris=ephemeris_id(eph),
+        latitude=site['latitude'], longitude=site['longitude'],
+        min_mw_altitude=min_mw_altitude, dark_sun_altitude=mw.DARK_SUN_ALTITUDE,
+        max_moon_phase=mw.MAX_MOON_PHASE, refine=refine, galactic_center=mw.galactic_center_settings(),
+        refine_tolerance_seconds=mw.REFINE_TOLERANCE_SECONDS if refine else None,
+        step_minutes=mw.STEP_MINUTES, night_hours=mw.NIGHT_HOURS, days='calendar_year', tz=str(mw.TZ),
+    )
+
+def stored_years(conn, site_name, params_hash):
+    rows = conn.execute("SELECT year FROM partitions WHERE site = ? AND params_hash = ?",
+                        (site_name, params_hash))
+    return {year for (year,) in rows}
+
+def missing_partitions(conn, eph, sites, years, min_mw_altitude=None, refine=None):
+    # คืน {ปี: [(สถานที่, hash, params), ...]} เฉพาะที่ยังไม่มีในฐานข้อมูลด้วยพารามิเตอร์ปัจจุบัน
+    missing = {}
+    for site in sites:
+        digest, params = site_params(eph, site, min_mw_altitude, refine)
+        have = stored_years(conn, site['name'], digest)
+        for year in years:
+            if year not in have:
+                missing.setdefault(year, []).append((site, digest, params))
+    return missing
+
+def save_partition(conn, site, year, digest, params, records):
+    # บันทึกผลของ (สถานที่, ปี) ใน transaction เดียว: หยุดกลางคันแล้วรันใหม่ จะคำนวณต่อจากปีที่ยังไม่เสร็จ
+    with conn:
+        conn.execute("DELETE FROM windows WHERE site = ? AND params_hash = ? AND year = ?",
+                     (site['name'], digest, year))
+        conn.executemany("INSERT INTO windows VALUES (?, ?, ?, ?, ?, ?)",
+                         [(site['name'], digest, r['Date'], r['Start'], r['End'], year) for r in records])
+        conn.execute("INSERT OR REPLACE INTO partitions VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                     (site['name'], year, digest, json.dumps(params, sort_keys=True, default=str),
+                      site['latitude'], site['longitude'], len(records),
+                      datetime.now().isoformat(timespec='seconds')))
+
+def update_store(conn, eph, ts, sites, years, min_mw_altitude=None, refine=None, workers=None, verbose=True):
+    # คำนวณเฉพาะ (สถานที่, ปี) ที่ขาด ปีละครั้ง: state ของปีนั้นใช้ร่วมกันทุกสถานที่ที่ขาด
+    # คืนจำนวน partition ที่คำนวณใหม่
+    min_mw_altitude = mw.MIN_MW_ALTITUDE if min_mw_altitude is None else min_mw_altitude
+    refine = mw.REFINE_EDGES if refine is None else refine
+    check_site_names(sites)
+    missing = missing_partitions(conn, eph, sites, years, min_mw_altitude, refine)
+    computed = 0
+    for year in sorted(missing):
+        entries = missing[year]
+        if verbose:
+            print(f"   - ปี {year}: คำนวณ {len(entries)} สถานที่")
+        with stage('geocentric_state'):
+            state, check_start, minutes = year_state(eph, ts, year)
+        year_sites = [site for site, _, _ in entries]
+        windows = iter_sites_windows(state, check_start, minutes, year_sites, min_mw_altitude, refine, workers)
+        for (site, digest, params), records in zip(entries, windows):
+            with stage('store_write'):
+                save_partition(conn, site, year, digest, params, records)
+            computed += 1
+    return computed
+
+def query_windows(conn, eph, site, start_date, end_date, min_mw_altitude=None, refine=None):
+    # อ่านช่วงวันที่ของสถานที่เดียวจาก index windows_by_date (site, params_hash, date, start) ไม่คำนวณใหม่
+    # คืนรายการ {"Date", "Start", "End"} (ปีที่ยังไม่ได้คำนวณจะไม่มีในผลลัพธ์ ให้เรียก update_store ก่อน)
+    digest, _ = site_params(eph, site, min_mw_altitude, refine)
+    rows = conn.execute("SELECT date, start, end FROM windows WHERE site = ? AND params_hash = ? "
+                        "AND date BETWEEN ? AND ? ORDER BY date, start", (site['name'], digest, start_date, end_date))
+    for date, start, end in rows:
+        yield {"Date": date, "Start": start, "End": end}
+
+def windows_between(conn, eph, ts, site, start_date, end_date, min_mw_altitude=None, refine=None):
+    # เหมือน query_windows แต่คำนวณปีที่ขาดในช่วงวันที่ให้ก่อน
+    years = range(int(start_date[:4]), int(end_date[:4]) + 1)
+    update_store(conn, eph, ts, [site], years, min_mw_altitude, refine, verbose=False)
+    return list(query_windows(conn, eph, site, start_date, end_date, min_mw_altitude, refine))
+
+def prune_store(conn, eph, sites, min_mw_altitude=None, refine=None):
+    # ลบผลที่คำนวณด้วยพารามิเตอร์เก่าของสถานที่ใน sites ออก คืนจำนวนคืนที่ลบ
+    removed = 0
+    with conn:
+        for site in sites:
+            digest, _ = site_params(eph, site, min_mw_altitude, refine)
+            removed += conn.execute("DELETE FROM windows WHERE site = ? AND params_hash != ?",
+                                    (site['name'], digest)).rowcount
+            conn.execute("DELETE FROM partitions WHERE site = ? AND params_hash != ?", (site['name'], digest))
+    return removed
+
+def update_milkyway_store():
+    years = range(START_YEAR, END_YEAR + 1)
+    print(f"กำลังอัปเดต {STORE_FILENAME} ปี {START_YEAR}-{END_YEAR} สำหรับ {len(STORE_SITES)} สถานที่...")
+
+    with stage('ephemeris_load'):
+        eph = ephemeris('de440s.bsp', years)
+        ts = timescale()
+
+    conn = open_store(STORE_FILENAME)
+    try:
+        computed = update_store(conn, eph, ts, STORE_SITES, years)
+        total = len(STORE_SITES) * len(years)
+        print(f"\nคำนวณใหม่ {computed} จาก {total} (สถานที่ x ปี) ที่เหลือใช้ผลเดิม: {os.path.abspath(STORE_FILENAME)}")
+
+        if QUERY_SITE:
+            site = next(s for s in STORE_SITES if s['name'] == QUERY_SITE)
+            results = query_windows(conn, eph, site, QUERY_START, QUERY_END)
+            if QUERY_OUTPUT_FILENAME:
+                count = write_records(results, QUERY_OUTPUT_FILENAME,
+                                      latitude=site['latitude'], longitude=site['longitude'])
+                print(f"บันทึก {count} คืนสำเร็จ: {os.path.abspath(QUERY_OUTPUT_FILENAME)}")
+            else:
+                print(f"\n# {site['name']} ({QUERY_START} - {QUERY_END})")
+                print("data = [")
+                for r in results:
+                    print(f'    {{"Date": "{r["Date"]}", "Start": "{r["Start"]}", "End": "{r["End"]}"}},')
+                print("]")
+    finally:
+        conn.close()
+
+if __name__ == "__main__":
+    update_milkyway_store()
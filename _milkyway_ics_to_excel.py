@@ -1,13 +1,44 @@
-import icalendar
 import pandas as pd
+import numpy as np
 import re
+import csv
+import os
+import glob
+from concurrent.futures import ProcessPoolExecutor
 from datetime import datetime
 import pytz
 
+from _milkyway_output import unfold_ics_lines
+from _stargazing_profile import stage, profiled
+
+# คอลัมน์ของไฟล์ผลลัพธ์ (เรียงตามนี้)
+COLUMNS = [
+    'Date', 'Time Start', 'Time End', 'Duration (Minutes)', 
+    'Max Altitude (deg)', 'Event Name', 'Latitude', 'Longitude', 'Raw Description'
+]
+
+# Regex ที่ใช้ดึงค่าจาก DESCRIPTION (compile ครั้งเดียว ใช้กับทุก event)
+LAT_RE = re.compile(r'Lat\s*([\d\.]+)')
+LON_RE = re.compile(r'Lon\s*([\d\.]+)')
+MAX_ALT_RE = re.compile(r'MaxAlt\s*~?(\d+)')
+TZID_RE = re.compile(r'(?:^|;)TZID="?([^";]+)"?', re.IGNORECASE)
+ESCAPE_RE = re.compile(r'\\([\\;,nN])')
+
+# property ที่ใช้ของแต่ละ VEVENT (UID ใช้ตัดรายการซ้ำตอนรวมหลายไฟล์)
+EVENT_PROPERTIES = ('DTSTART', 'DTEND', 'SUMMARY', 'DESCRIPTION', 'UID')
+
+# รวมหลายไฟล์: จำนวน process (None = จำนวน core) และจำนวนไฟล์ขั้นต่ำที่จะเริ่มใช้ process pool
+BATCH_WORKERS = None
+PARALLEL_MIN_FILES = 4
+
+@profiled()
 def ics_to_excel(ics_file_path, output_excel_path):
+    # icalendar ใช้เฉพาะแบบนี้ (แบบ streaming อ่านเอง) จึง import ตอนเรียกใช้
+    import icalendar
+
     # 1. เปิดและอ่านไฟล์ ICS
     try:
-        with open(ics_file_path, 'rb') as f:
+        with open(ics_file_path, 'rb') as f, stage('ics_parse'):
             cal = icalendar.Calendar.from_ical(f.read())
     except FileNotFoundError:
         print(f"Error: ไม่พบไฟล์ {ics_file_path}")
@@ -82,9 +113,9 @@ def ics_to_excel(ics_file_path, output_excel_path):
             event_data['Raw Description'] = desc_text
 
             # ใช้ Regular Expression (Regex) เพื่อดึงค่าตัวเลขออกมา
-            lat_match = re.search(r'Lat\s*([\d\.]+)', desc_text)
-            lon_match = re.search(r'Lon\s*([\d\.]+)', desc_text)
-            max_alt_match = re.search(r'MaxAlt\s*~?(\d+)', desc_text)
+            lat_match = LAT_RE.search(desc_text)
+            lon_match = LON_RE.search(desc_text)
+            max_alt_match = MAX_ALT_RE.search(desc_text)
 
             event_data['Latitude'] = float(lat_match.group(1)) if lat_match else None
             event_data['Longitude'] = float(lon_match.group(1)) if lon_match else None
@@ -101,21 +132,293 @@ def ics_to_excel(ics_file_path, output_excel_path):
             df = df.sort_values(by='Start Time')
         
         # จัดลำดับคอลัมน์ใหม่
-        columns_order = [
-            'Date', 'Time Start', 'Time End', 'Duration (Minutes)', 
-            'Max Altitude (deg)', 'Event Name', 'Latitude', 'Longitude', 'Raw Description'
-        ]
+        columns_order = COLUMNS
         existing_cols = [col for col in columns_order if col in df.columns]
         df = df[existing_cols]
 
-        df.to_excel(output_excel_path, index=False)
+        with stage('excel_write'):
+            df.to_excel(output_excel_path, index=False)
         print(f"สร้างไฟล์ Excel สำเร็จ: {output_excel_path}")
         print(f"จำนวนรายการทั้งหมด: {len(df)}")
     else:
         print("ไม่พบข้อมูล Event ในไฟล์ ICS")
 
+def iter_vevents(f):
+    # อ่าน VEVENT ทีละ event จากไฟล์ (ไม่โหลดทั้งไฟล์) คืน dict {property: (params, value)}
+    # ข้าม property ของ component ที่ซ้อนอยู่ข้างใน เช่น VALARM
+    event = None
+    depth = 0
+    for line in unfold_ics_lines(f):
+        name_params, _, value = line.partition(':')
+        name, _, params = name_params.partition(';')
+        name = name.upper()
+        if name == 'BEGIN':
+            if event is not None:
+                depth += 1
+            elif value.upper() == 'VEVENT':
+                event = {}
+                depth = 0
+        elif name == 'END' and event is not None:
+            if depth:
+                depth -= 1
+            elif value.upper() == 'VEVENT':
+                yield event
+                event = None
+        elif event is not None and not depth and name in EVENT_PROPERTIES:
+            event.setdefault(name, (params, value))
+
+def _unescape(text):
+    return ESCAPE_RE.sub(lambda m: '\n' if m.group(1) in 'nN' else m.group(1), text)
+
+def _local_times(props, thai_tz):
+    # แปลงเวลา (params, value) ทั้ง chunk เป็นเวลาไทยในครั้งเดียวด้วย pandas
+    # คืน Series tz-aware (NaT = ไม่มีค่า หรือเป็นวันที่แบบทั้งวัน)
+    values = pd.Series([prop[1].strip() if prop else None for prop in props], dtype=object)
+    tzids = pd.Series([(TZID_RE.search(prop[0]) or [None, None])[1] if prop else None for prop in props],
+                      dtype=object)
+    result = pd.Series(pd.NaT, index=values.index, dtype=f"datetime64[ns, {thai_tz.zone}]")
+
+    is_datetime = values.str.contains('T', na=False)
+    if not is_datetime.any():
+        return result
+    naive = pd.to_datetime(values[is_datetime].str[:15], format="%Y%m%dT%H%M%S")
+    zones = tzids[is_datetime]
+    # ลงท้ายด้วย Z หรือไม่มี TZID ถือเป็น UTC เหมือน ics_to_excel()
+    utc = values[is_datetime].str.endswith('Z') | zones.isna()
+    converted = pd.Series(pd.NaT, index=naive.index, dtype=result.dtype)
+    if utc.any():
+        converted[utc] = naive[utc].dt.tz_localize('UTC').dt.tz_convert(thai_tz.zone)
+    for zone in zones[~utc].unique():
+        mask = ~utc & (zones == zone)
+        try:
+            # เวลาที่ซ้ำ/ไม่มีอยู่จริงช่วงเปลี่ยน DST ตีความแบบเดียวกับ icalendar (zoneinfo fold=0)
+            local = naive[mask].dt.tz_localize(zone, ambiguous=np.ones(mask.sum(), dtype=bool),
+                                               nonexistent=pd.Timedelta(hours=1))
+        except Exception:
+            # TZID ที่ไม่รู้จัก ถือเป็น UTC
+            local = naive[mask].dt.tz_localize('UTC')
+        converted[mask] = local.dt.tz_convert(thai_tz.zone)
+    result[is_datetime] = converted
+    return result
+
+def _date_text(prop):
+    value = prop[1].strip()
+    return f"{value[:4]}-{value[4:6]}-{value[6:8]}"
+
+def _chunk_rows(events, thai_tz, starts=None):
+    # แปลง event หลายรายการเป็นแถวของตาราง (คอลัมน์ตาม COLUMNS) ส่ง starts ที่แปลงไว้แล้วมาได้
+    if starts is None:
+        starts = _local_times([e.get('DTSTART') for e in events], thai_tz)
+    ends = _local_times([e.get('DTEND') for e in events], thai_tz)
+    # แปลงเป็น list ครั้งเดียว (เลี่ยง .iloc ทีละแถวซึ่งช้ากว่ามาก)
+    start_missing = starts.isna().tolist()
+    end_missing = ends.isna().tolist()
+    start_date = starts.dt.strftime('%Y-%m-%d').tolist()
+    start_hm = starts.dt.strftime('%H:%M').tolist()
+    end_hm = ends.dt.strftime('%H:%M').tolist()
+    durations = ((ends - starts).dt.total_seconds() / 60).to_numpy()
+
+    rows = []
+    for i, event in enumerate(events):
+        start_is_datetime = not start_missing[i]
+        if start_is_datetime:
+            date, time_start = start_date[i], start_hm[i]
+        else:
+            date, time_start = _date_text(event['DTSTART']), "All Day"
+
+        if 'DTEND' not in event:
+            time_end, duration = "", 0
+        elif end_missing[i]:
+            time_end, duration = "", 0
+        else:
+            time_end = end_hm[i]
+            duration = int(durations[i]) if start_is_datetime else None
+
+        summary = _unescape(event['SUMMARY'][1]) if 'SUMMARY' in event else ""
+        desc_text = _unescape(event['DESCRIPTION'][1]) if 'DESCRIPTION' in event else ""
+        lat_match = LAT_RE.search(desc_text)
+        lon_match = LON_RE.search(desc_text)
+        max_alt_match = MAX_ALT_RE.search(desc_text)
+
+        rows.append([
+            date, time_start, time_end, duration,
+            int(max_alt_match.group(1)) if max_alt_match else None,
+            summary,
+            float(lat_match.group(1)) if lat_match else None,
+            float(lon_match.group(1)) if lon_match else None,
+            desc_text,
+        ])
+    return rows
+
+def _write_chunk(write_rows, events, thai_tz):
+    with stage('chunk_convert'):
+        rows = _chunk_rows(events, thai_tz)
+    with stage('row_write'):
+        write_rows(rows)
+
+def _row_writer(output_path):
+    # เปิดไฟล์ผลลัพธ์ตามนามสกุล คืน (ฟังก์ชันเขียนแถว, ฟังก์ชันปิดไฟล์)
+    ext = os.path.splitext(output_path)[1].lower()
+    if ext == '.csv':
+        f = open(output_path, 'w', encoding='utf-8-sig', newline='')
+        writer = csv.writer(f)
+        writer.writerow(COLUMNS)
+        return writer.writerows, f.close
+
+    if ext == '.parquet':
+        try:
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+        except ImportError:
+            raise ImportError("เขียนไฟล์ .parquet ต้องติดตั้ง pyarrow ก่อน (pip3 install pyarrow)")
+        schema = pa.schema([
+            ('Date', pa.string()), ('Time Start', pa.string()), ('Time End', pa.string()),
+            ('Duration (Minutes)', pa.int64()), ('Max Altitude (deg)', pa.int64()),
+            ('Event Name', pa.string()), ('Latitude', pa.float64()), ('Longitude', pa.float64()),
+            ('Raw Description', pa.string()),
+        ])
+        parquet = pq.ParquetWriter(output_path, schema)
+
+        def write_parquet(rows):
+            parquet.write_table(pa.Table.from_arrays([pa.array(col, type=field.type)
+                                                      for col, field in zip(zip(*rows), schema)], schema=schema))
+        return write_parquet, parquet.close
+
+    # .xlsx: openpyxl แบบ write-only เขียนแถวลงไฟล์ชั่วคราวทันที ไม่เก็บทั้งชีตไว้ในหน่วยความจำ
+    from openpyxl import Workbook
+    workbook = Workbook(write_only=True)
+    sheet = workbook.create_sheet()
+    sheet.append(COLUMNS)
+
+    def write_xlsx(rows):
+        for row in rows:
+            sheet.append(row)
+    return write_xlsx, lambda: workbook.save(output_path)
+
+@profiled()
+def ics_to_excel_streaming(ics_file_path, output_path, chunk_size=5000):
+    # แบบ streaming สำหรับไฟล์ใหญ่: อ่านทีละ event แปลงเวลาทีละ chunk แล้วเขียนต่อท้ายไฟล์ทันที
+    # หน่วยความจำคงที่ไม่ว่าไฟล์จะใหญ่แค่ไหน แต่แถวจะเรียงตามลำดับในไฟล์ ICS (ไม่เรียงตามเวลาเริ่ม)
+    # รองรับ output .xlsx, .csv และ .parquet (ต้องติดตั้ง pyarrow)
+    thai_tz = pytz.timezone('Asia/Bangkok')
+    try:
+        f = open(ics_file_path, encoding='utf-8', errors='replace')
+    except FileNotFoundError:
+        print(f"Error: ไม่พบไฟล์ {ics_file_path}")
+        return
+
+    write_rows, close = _row_writer(output_path)
+    count = 0
+    chunk = []
+    with f:
+        for event in iter_vevents(f):
+            if 'DTSTART' not in event:
+                continue # ข้ามถ้าไม่มีเวลาเริ่ม
+            chunk.append(event)
+            if len(chunk) >= chunk_size:
+                _write_chunk(write_rows, chunk, thai_tz)
+                count += len(chunk)
+                chunk = []
+        if chunk:
+            _write_chunk(write_rows, chunk, thai_tz)
+            count += len(chunk)
+    with stage('row_write'):
+        close()
+
+    if count:
+        print(f"สร้างไฟล์สำเร็จ: {output_path}")
+        print(f"จำนวนรายการทั้งหมด: {count}")
+    else:
+        print("ไม่พบข้อมูล Event ในไฟล์ ICS")
+
+def ics_paths(source):
+    # โฟลเดอร์ (ทุกไฟล์ .ics ข้างใน), glob เช่น 'calendars/*/*.ics' หรือ list ของ path คืนรายการเรียงตามชื่อ
+    if isinstance(source, (list, tuple)):
+        return sorted(source)
+    if os.path.isdir(source):
+        return sorted(glob.glob(os.path.join(source, '*.ics')))
+    return sorted(glob.glob(source))
+
+def _file_rows(path):
+    # แปลงไฟล์ ICS เดียวเป็น (แถวของตาราง, เวลาเริ่มสำหรับเรียง, UID) ทำงานใน worker ของ process pool
+    thai_tz = pytz.timezone('Asia/Bangkok')
+    with open(path, encoding='utf-8', errors='replace') as f:
+        events = [event for event in iter_vevents(f) if 'DTSTART' in event]
+    if not events:
+        return [], [], []
+    starts = _local_times([e['DTSTART'] for e in events], thai_tz)
+    # เวลาเริ่มแบบเดียวกับคอลัมน์ Start Time ของ ics_to_excel() (วันที่แบบทั้งวันใช้ YYYY-MM-DD)
+    keys = [_date_text(e['DTSTART']) if missing else text for e, text, missing in
+            zip(events, starts.dt.strftime('%Y-%m-%d %H:%M:%S').tolist(), starts.isna().tolist())]
+    uids = [e['UID'][1].strip() if 'UID' in e else None for e in events]
+    return _chunk_rows(events, thai_tz, starts), keys, uids
+
+def _iter_file_rows(paths, workers):
+    # ส่งผลของแต่ละไฟล์ออกตามลำดับ paths (ใช้ process pool เมื่อมีหลายไฟล์)
+    if len(paths) < PARALLEL_MIN_FILES or workers == 1:
+        for path in paths:
+            yield _file_rows(path)
+        return
+    workers = workers or os.cpu_count()
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        yield from pool.map(_file_rows, paths, chunksize=max(1, len(paths) // (4 * workers)))
+
+@profiled()
+def ics_batch_to_excel(source, output_path, workers=None, chunk_size=5000):
+    # รวมไฟล์ ICS หลายไฟล์ (โฟลเดอร์/glob/list) เป็นตารางเดียวเรียงตามเวลาเริ่ม เขียนเป็น .xlsx, .csv หรือ .parquet
+    # แต่ละไฟล์แปลงใน process pool, event ที่ UID และเวลาเริ่มตรงกันนับครั้งเดียว (เก็บรายการแรกตามลำดับชื่อไฟล์)
+    # event ที่ไม่มี UID ไม่ถูกตัดออก
+    workers = BATCH_WORKERS if workers is None else workers
+    paths = ics_paths(source)
+    if not paths:
+        print(f"Error: ไม่พบไฟล์ ICS จาก {source}")
+        return
+
+    rows = []
+    keys = []
+    seen = set() # hash index ของ (UID, เวลาเริ่ม)
+    duplicates = 0
+    with stage('ics_parse'):
+        for file_rows, file_keys, file_uids in _iter_file_rows(paths, workers):
+            for row, key, uid in zip(file_rows, file_keys, file_uids):
+                if uid is not None:
+                    if (uid, key) in seen:
+                        duplicates += 1
+                        continue
+                    seen.add((uid, key))
+                rows.append(row)
+                keys.append(key)
+
+    if not rows:
+        print("ไม่พบข้อมูล Event ในไฟล์ ICS")
+        return
+
+    # เรียงตามเวลาเริ่ม (sort ของ Python เป็น stable: เวลาเท่ากันคงลำดับไฟล์/ลำดับในไฟล์เดิม)
+    order = sorted(range(len(keys)), key=keys.__getitem__)
+    write_rows, close = _row_writer(output_path)
+    with stage('row_write'):
+        for i in range(0, len(order), chunk_size):
+            write_rows([rows[j] for j in order[i:i + chunk_size]])
+        close()
+
+    print(f"สร้างไฟล์สำเร็จ: {output_path}")
+    print(f"รวม {len(paths)} ไฟล์ จำนวนรายการทั้งหมด: {len(rows)} (ตัดรายการซ้ำ {duplicates} รายการ)")
+
 # --- เรียกใช้งานฟังก์ชัน ---
 input_filename = 'StarGazing.ics' 
 output_filename = 'StarGazing_Schedule.xlsx'
 
-ics_to_excel(input_filename, output_filename)
\ No newline at end of file
+# True = ใช้ ics_to_excel_streaming() สำหรับไฟล์ ICS ขนาดใหญ่ (หลายหมื่น event)
+# output_filename ใช้ .csv หรือ .parquet ได้ด้วย
+streaming = False
+
+# รวมหลายไฟล์: ระบุโฟลเดอร์หรือ glob (เช่น 'calendars/*.ics') แทน input_filename (None = ไฟล์เดียวแบบเดิม)
+batch_source = None
+
+if __name__ == "__main__":
+    if batch_source:
+        ics_batch_to_excel(batch_source, output_filename)
+    elif streaming:
+        ics_to_excel_streaming(input_filename, output_filename)
+    else:
+        ics_to_excel(input_filename, output_filename)
\ No newline at end of file
@@ -0,0 +1,158 @@
+import csv
+import json
+import os
+from datetime import datetime, timedelta
+import pytz
+
+# เขียน/อ่านรายการช่วงถ่ายทางช้างเผือก {"Date", "Start", "End"} (อาจมี "Site", "Latitude", "Longitude")
+# ทุก writer รับ iterable/generator และเขียนทีละรายการ จึงใช้หน่วยความจำคงที่ไม่ว่าจะกี่ปี/กี่สถานที่
+
+TZ = pytz.timezone('Asia/Bangkok')
+EVENT_SUMMARY = "Milky Way"
+
+def night_datetimes(record, tz=TZ):
+    # เวลาเริ่ม/จบของรายการเป็น datetime (ถ้า End น้อยกว่า Start แปลว่าจบหลังเที่ยงคืน)
+    start = datetime.strptime(f"{record['Date']} {record['Start']}", "%Y-%m-%d %H:%M")
+    end = datetime.strptime(f"{record['Date']} {record['End']}", "%Y-%m-%d %H:%M")
+    if end < start:
+        end += timedelta(days=1)
+    return tz.localize(start), tz.localize(end)
+
+def write_jsonl(records, path):
+    count = 0
+    with open(path, 'w', encoding='utf-8') as f:
+        for record in records:
+            f.write(json.dumps(record, ensure_ascii=False) + "\n")
+            f.flush()
+            count += 1
+    return count
+
+def write_csv(records, path):
+    # หัวตารางใช้ key ของรายการแรก
+    count = 0
+    with open(path, 'w', encoding='utf-8', newline='') as f:
+        writer = None
+        for record in records:
+            if writer is None:
+                writer = csv.DictWriter(f, fieldnames=list(record))
+                writer.writeheader()
+            writer.writerow(record)
+            f.flush()
+            count += 1
+    return count
+
+def _ics_time(dt):
+    return dt.astimezone(pytz.utc).strftime("%Y%m%dT%H%M%SZ")
+
+def write_ics(records, path, latitude=None, longitude=None, tz=TZ):
+    # 1 VEVENT ต่อคืน, DESCRIPTION มี Lat/Lon แบบเดียวกับที่ _milkyway_ics_to_excel.py อ่าน
+    count = 0
+    stamp = _ics_time(datetime.now(pytz.utc))
+    with open(path, 'w', encoding='utf-8', newline='') as f:
+        f.write("BEGIN:VCALENDAR\r\nVERSION:2.0\r\nPRODID:-//StarGazing//Milky Way//TH\r\n")
+        for record in records:
+            start, end = night_datetimes(record, tz)
+            site = record.get('Site')
+            lat = record.get('Latitude', latitude)
+            lon = record.get('Longitude', longitude)
+            description = f"Lat {lat} Lon {lon}" if lat is not None else ""
+            f.write("BEGIN:VEVENT\r\n"
+                    f"UID:{_ics_time(start)}-{(site or 'site').replace(' ', '_')}@stargazing\r\n"
+                    f"DTSTAMP:{stamp}\r\n"
+                    f"DTSTART:{_ics_time(start)}\r\n"
+                    f"DTEND:{_ics_time(end)}\r\n"
+                    f"SUMMARY:{EVENT_SUMMARY}{f' - {site}' if site else ''}\r\n"
+                    f"DESCRIPTION:{description}\r\n"
+                    "END:VEVENT\r\n")
+            f.flush()
+            count += 1
+        f.write("END:VCALENDAR\r\n")
+    return count
+
+WRITERS = {
+    '.jsonl': write_jsonl,
+    '.csv': write_csv,
+    '.ics': write_ics,
+}
+
+def write_records(records, path, **kwargs):
+    # เลือก writer จากนามสกุลไฟล์ คืนจำนวนรายการที่เขียน
+    ext = os.path.splitext(path)[1].lower()
+    if ext not in WRITERS:
+        raise ValueError(f"ไม่รองรับไฟล์ {ext} (ใช้ {', '.join(WRITERS)})")
+    if ext == '.ics':
+        return write_ics(records, path, **kwargs)
+    return WRITERS[ext](records, path)
+
+def unfold_ics_lines(f):
+    # คืนบรรทัดของ ICS ทีละบรรทัด โดยต่อบรรทัดที่ถูกพับ (ขึ้นต้นด้วยช่องว่าง) เข้าด้วยกัน
+    current = None
+    for line in f:
+        line = line.rstrip('\r\n')
+        if line[:1] in (' ', '\t') and current is not None:
+            current += line[1:]
+            continue
+        if current is not None:
+            yield current
+        current = line
+    if current is not None:
+        yield current
+
+def _parse_ics_time(name_params, value, tz):
+    params = dict(p.split('=', 1) for p in name_params.split(';')[1:] if '=' in p)
+    dt = datetime.strptime(value[:15], "%Y%m%dT%H%M%S")
+    if value.endswith('Z'):
+        return pytz.utc.localize(dt).astimezone(tz)
+    if 'TZID' in params:
+        return pytz.timezone(params['TZID']).localize(dt).astimezone(tz)
+    return tz.localize(dt)
+
+def _read_ics(path, tz):
+    with open(path, encoding='utf-8') as f:
+        event = None
+        for line in unfold_ics_lines(f):
+            name_params, _, value = line.partition(':')
+            name = name_params.split(';', 1)[0].upper()
+            if name == 'BEGIN' and value == 'VEVENT':
+                event = {}
+            elif name == 'END' and value == 'VEVENT':
+                if 'DTSTART' in event and 'DTEND' in event:
+                    record = {
+                        "Date": event['DTSTART'].strftime("%Y-%m-%d"),
+                        "Start": event['DTSTART'].strftime("%H:%M"),
+                        "End": event['DTEND'].strftime("%H:%M"),
+                    }
+                    if ' - ' in event.get('SUMMARY', ''):
+                        record["Site"] = event['SUMMARY'].split(' - ', 1)[1]
+                    yield record
+                event = None
+            elif event is not None and name in ('DTSTART', 'DTEND') and 'T' in value:
+                event[name] = _parse_ics_time(name_params, value, tz)
+            elif event is not None and name == 'SUMMARY':
+                event[name] = value
+
+def read_records(path, tz=TZ):
+    # อ่านรายการทีละคืนจาก .jsonl / .csv / .ics (หรือ .json ที่อ่านทั้งก้อน)
+    ext = os.path.splitext(path)[1].lower()
+    if ext == '.jsonl':
+        with open(path, encoding='utf-8') as f:
+            for line in f:
+                if line.strip():
+                    yield json.loads(line)
+    elif ext == '.csv':
+        with open(path, encoding='utf-8', newline='') as f:
+            yield from csv.DictReader(f)
+    elif ext == '.ics':
+        yield from _read_ics(path, tz)
+    elif ext == '.json':
+        with open(path, encoding='utf-8') as f:
+            data = json.load(f)
+        if isinstance(data, dict):
+            # ไฟล์จาก _milkyway_create_data_set_by_sites.py: {"ชื่อสถานที่": [รายการ, ...]}
+            for site, site_records in data.items():
+                for record in site_records:
+                    yield {"Site": site, **record}
+        else:
+            yield from data
+    else:
+        raise ValueError(f"ไม่รองรับไฟล์ {ext}")
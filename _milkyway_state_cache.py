@@ -0,0 +1,87 @@
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+import time
+import numpy as np
+
+# =================ตั้งค่า Cache=================
+# เก็บ array ที่คำนวณแล้ว (ตำแหน่ง/มุมสูงดวงอาทิตย์ ดวงจันทร์ เฟสดวงจันทร์ ฯลฯ) เป็นไฟล์ .npy
+# รันครั้งถัดไปด้วยปี/step/สถานที่เดิม จะอ่านจากไฟล์ (memory-map) แทนการคำนวณ ephemeris ใหม่
+CACHE_DIR = os.environ.get('STARGAZING_CACHE_DIR', '.stargazing_cache')
+
+# ขนาดรวมสูงสุดของ cache (MB) ถ้าเกินจะลบรายการที่ไม่ได้ใช้นานที่สุดออกก่อน
+CACHE_MAX_MB = 512
+# ====================================================
+
+def ephemeris_id(eph):
+    # ระบุไฟล์ ephemeris ด้วยชื่อ + ขนาด + เวลาแก้ไข (เปลี่ยนไฟล์ใหม่แล้ว cache เดิมจะไม่ถูกใช้)
+    # ไฟล์ที่ตัดช่วงปี (_stargazing_ephemeris.py) ใช้ไฟล์ต้นฉบับ: ค่าในช่วงปีเหมือนกันทุกบิต จึงใช้ cache ร่วมกันได้
+    path = getattr(eph, 'source_path', None)
+    if path is None or not os.path.exists(path):
+        path = eph.path
+    stat = os.stat(path)
+    return f"{os.path.basename(path)}:{stat.st_size}:{int(stat.st_mtime)}"
+
+def cache_key(**parts):
+    # สร้าง key จากพารามิเตอร์ทั้งหมด (เรียงตามชื่อ) เช่น ephemeris, year, step, site
+    text = json.dumps(parts, sort_keys=True, default=str)
+    return hashlib.sha1(text.encode('utf-8')).hexdigest()[:20], parts
+
+def load_arrays(key, cache_dir=CACHE_DIR):
+    # อ่าน array ทั้งหมดของ key แบบ memory-map (ไม่โหลดเข้า RAM จนกว่าจะใช้งาน) ถ้าไม่มีคืน None
+    digest, _ = key
+    entry = os.path.join(cache_dir, digest)
+    try:
+        with open(os.path.join(entry, 'meta.json'), encoding='utf-8') as f:
+            names = json.load(f)['arrays']
+        arrays = {name: np.load(os.path.join(entry, f"{name}.npy"), mmap_mode='r') for name in names}
+    except (FileNotFoundError, NotADirectoryError, ValueError, KeyError):
+        return None
+
+    # อัปเดตเวลาใช้งานล่าสุด สำหรับการลบแบบ LRU
+    now = time.time()
+    os.utime(entry, (now, now))
+    return arrays
+
+def save_arrays(key, arrays, cache_dir=CACHE_DIR, max_mb=CACHE_MAX_MB):
+    # เขียนลงโฟลเดอร์ชั่วคราวก่อนแล้วค่อย rename ป้องกันไฟล์เสียถ้ามีหลาย process เขียนพร้อมกัน
+    digest, parts = key
+    os.makedirs(cache_dir, exist_ok=True)
+    tmp = tempfile.mkdtemp(prefix=f".{digest}-", dir=cache_dir)
+    try:
+        for name, array in arrays.items():
+            np.save(os.path.join(tmp, f"{name}.npy"), np.ascontiguousarray(array))
+        with open(os.path.join(tmp, 'meta.json'), 'w', encoding='utf-8') as f:
+            json.dump({'key': parts, 'arrays': list(arrays)}, f, indent=4, default=str)
+        os.replace(tmp, os.path.join(cache_dir, digest))
+    except OSError:
+        # มี process อื่นเขียน key เดียวกันเสร็จก่อนแล้ว
+        shutil.rmtree(tmp, ignore_errors=True)
+    evict(cache_dir, max_mb)
+
+def cached_arrays(key, compute, cache_dir=CACHE_DIR, max_mb=CACHE_MAX_MB):
+    # คืนค่าจาก cache ถ้ามี ไม่อย่างนั้นเรียก compute() (ต้องคืน dict ของ array) แล้วบันทึก
+    arrays = load_arrays(key, cache_dir)
+    if arrays is None:
+        arrays = compute()
+        save_arrays(key, arrays, cache_dir, max_mb)
+    return arrays
+
+def evict(cache_dir=CACHE_DIR, max_mb=CACHE_MAX_MB):
+    # ลบรายการที่ใช้ล่าสุดนานที่สุดจนขนาดรวมไม่เกิน max_mb
+    entries = []
+    for name in os.listdir(cache_dir):
+        entry = os.path.join(cache_dir, name)
+        if name.startswith('.') or not os.path.isdir(entry):
+            continue
+        size = sum(f.stat().st_size for f in os.scandir(entry) if f.is_file())
+        entries.append((os.stat(entry).st_mtime, size, entry))
+
+    total = sum(size for _, size, _ in entries)
+    for _, size, entry in sorted(entries):
+        if total <= max_mb * 1024 * 1024:
+            break
+        shutil.rmtree(entry, ignore_errors=True)
+        total -= size
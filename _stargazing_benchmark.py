@@ -0,0 +1,263 @@
+from skyfield.api import load, Topos
+from skyfield.data import mpc
+from skyfield.constants import GM_SUN_Pitjeva_2005_km3_s2
+from skyfield.jpllib import SpiceKernel
+from datetime import datetime, timedelta
+import numpy as np
+import pandas as pd
+import contextlib
+import io
+import platform
+import subprocess
+import tempfile
+import json
+import time
+import os
+
+import _comet_check_by_year_and_month as comet_search
+from _comet_orbit_engine import orbital_elements, screen_magnitudes, closest_approach
+from _comet_results_store import open_store as open_comet_store
+from _milkyway_create_data_set import (
+    milkyway_windows_year, calculate_milkyway_window_daily, build_year_grid, GALACTIC_CENTER,
+)
+from _milkyway_create_data_set_by_sites import milkyway_windows_sites
+from _milkyway_create_calendar_by_data_set import prepare_frame, render_chart, render_batch
+from _milkyway_ics_to_excel import ics_to_excel, ics_to_excel_streaming
+from _stargazing_ephemeris import write_ephemeris_excerpt
+from _stargazing_fixed_star import fixed_star_altitudes
+
+# =================ตั้งค่า Benchmark=================
+# จับเวลาทุกขั้นตอนด้วยข้อมูลชุดเดิมทุกครั้ง ไม่ต่อเน็ต (ไม่มีไฟล์ ephemeris ในโฟลเดอร์ปัจจุบัน จะข้ามขั้นตอนที่ต้องใช้)
+FIXTURE_COMETS = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'benchmark_fixtures', 'CometEls.txt')
+MW_EPHEMERIS = 'de440s.bsp'
+COMET_EPHEMERIS = 'de421.bsp'
+
+YEAR = 2026
+LATITUDE = 14.4390
+LONGITUDE = 101.3725
+SITE_COUNT = 16             # จำนวนสถานที่สำหรับขั้นตอนหลายสถานที่
+COMET_MONTHS = (1, 3)       # ช่วงเดือนของการค้นหาดาวหาง
+CLOSEST_APPROACH_COMETS = 5 # จำนวนดาวหางที่ใช้จับเวลาการหา Perigee
+ICS_EVENTS = 50000          # จำนวน event ของไฟล์ ICS สังเคราะห์
+
+REPEAT = 3                  # รันซ้ำกี่รอบต่อขั้นตอน (ขั้นตอนที่ช้ามากรันรอบเดียว)
+STAGES = None               # เลือกเฉพาะบางขั้นตอน เช่น ['ephemeris_load', 'comet_screening'] (None = ทั้งหมด)
+
+# ผลลัพธ์บันทึกเป็น JSON ในโฟลเดอร์นี้ ถ้าระบุ BASELINE_FILE จะเทียบกับผลครั้งก่อนด้วย
+RESULTS_DIR = 'benchmark_results'
+BASELINE_FILE = None
+# ====================================================
+
+def _git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip() or None
+    except OSError:
+        return None
+
+def benchmark_sites(count=SITE_COUNT):
+    # สถานที่ตัวอย่างกระจายทั่วประเทศไทย (ค่าเดิมทุกครั้ง)
+    return [{"name": f"Site {i:02d}", "latitude": 6.0 + 14.0 * i / count, "longitude": 98.0 + 7.0 * ((i * 7) % count) / count}
+            for i in range(count)]
+
+def benchmark_windows(year=YEAR):
+    # ช่วงเวลาทางช้างเผือกสังเคราะห์ทั้งปี สำหรับจับเวลาการวาดกราฟ (ไม่ขึ้นกับ ephemeris)
+    records = []
+    for day in range(0, 365, 2):
+        date = datetime(year, 1, 1) + timedelta(days=day)
+        start = 18 * 60 + (day * 7) % 300
+        end = start + 30 + (day * 13) % 240
+        records.append({
+            "Date": date.strftime("%Y-%m-%d"),
+            "Start": f"{start // 60 % 24:02d}:{start % 60:02d}",
+            "End": f"{end // 60 % 24:02d}:{end % 60:02d}",
+        })
+    return records
+
+def write_benchmark_ics(path, count=ICS_EVENTS, seed=2026):
+    # ไฟล์ ICS สังเคราะห์รูปแบบเดียวกับ StarGazing.ics (เวลา UTC, Lat/Lon/MaxAlt ใน DESCRIPTION)
+    rng = np.random.default_rng(seed)
+    start = datetime(2020, 1, 1, 11, 0)
+    offsets = np.sort(rng.integers(0, 10 * 365 * 1440, count))
+    durations = rng.integers(20, 360, count)
+    lats = rng.uniform(5.0, 20.0, count)
+    lons = rng.uniform(97.0, 106.0, count)
+    alts = rng.integers(10, 60, count)
+    with open(path, 'w', encoding='utf-8', newline='') as f:
+        f.write("BEGIN:VCALENDAR\r\nVERSION:2.0\r\nPRODID:-//StarGazing//Benchmark//TH\r\n")
+        for i in range(count):
+            s = start + timedelta(minutes=int(offsets[i]))
+            e = s + timedelta(minutes=int(durations[i]))
+            f.write("BEGIN:VEVENT\r\n"
+                    f"UID:bench-{i}@stargazing\r\n"
+                    f"DTSTART:{s:%Y%m%dT%H%M%S}Z\r\n"
+                    f"DTEND:{e:%Y%m%dT%H%M%S}Z\r\n"
+                    "SUMMARY:Milky Way\r\n"
+                    f"DESCRIPTION:Lat {lats[i]:.4f} Lon {lons[i]:.4f} MaxAlt ~{alts[i]}\r\n"
+                    "END:VEVENT\r\n")
+        f.write("END:VCALENDAR\r\n")
+
+def time_stage(results, name, fn, repeat=None, requires=()):
+    # จับเวลา fn() repeat รอบ เก็บทุกรอบ + ค่าต่ำสุด/มัธยฐาน
+    if STAGES is not None and name not in STAGES:
+        return None
+    missing = [path for path in requires if not os.path.exists(path)]
+    if missing:
+        print(f"  - {name:<28} ข้าม (ไม่พบ {', '.join(missing)})")
+        results.append({"stage": name, "skipped": f"missing {', '.join(missing)}"})
+        return None
+
+    repeat = repeat or REPEAT
+    seconds = []
+    value = None
+    for _ in range(repeat):
+        # ไม่แสดงข้อความที่สคริปต์แต่ละตัวพิมพ์ระหว่างจับเวลา
+        with contextlib.redirect_stdout(io.StringIO()):
+            start = time.perf_counter()
+            value = fn()
+            seconds.append(time.perf_counter() - start)
+    record = {"stage": name, "seconds": seconds, "best": min(seconds), "median": float(np.median(seconds))}
+    results.append(record)
+    print(f"  - {name:<28} {record['best']:8.3f} s (best of {repeat})")
+    return value
+
+def run_benchmarks():
+    results = []
+    ts = load.timescale()
+    mw_eph = load(MW_EPHEMERIS) if os.path.exists(MW_EPHEMERIS) else None
+    comet_eph = load(COMET_EPHEMERIS) if os.path.exists(COMET_EPHEMERIS) else None
+    mw_needs = (MW_EPHEMERIS,)
+    comet_needs = (COMET_EPHEMERIS,)
+
+    print("โหลด ephemeris")
+    time_stage(results, 'ephemeris_load', lambda: (load(MW_EPHEMERIS), load(COMET_EPHEMERIS)),
+               requires=mw_needs + comet_needs)
+    with tempfile.TemporaryDirectory() as tmp:
+        excerpt = os.path.join(tmp, 'excerpt.bsp')
+        time_stage(results, 'ephemeris_excerpt', lambda: SpiceKernel(write_ephemeris_excerpt(
+            mw_eph, excerpt, YEAR, YEAR)).close(), requires=mw_needs)
+
+    print("ทางช้างเผือก")
+    time_stage(results, 'milkyway_one_site', lambda: milkyway_windows_year(
+        mw_eph, ts, LATITUDE, LONGITUDE, YEAR, use_cache=False), requires=mw_needs)
+    time_stage(results, 'milkyway_one_site_daily', lambda: list(calculate_milkyway_window_daily(
+        mw_eph, ts, YEAR)), repeat=1, requires=mw_needs)
+    time_stage(results, 'milkyway_sites', lambda: milkyway_windows_sites(
+        mw_eph, ts, benchmark_sites(SITE_COUNT), YEAR, workers=1, use_cache=False), requires=mw_needs)
+    if mw_eph is not None:
+        _, _, grid = build_year_grid(ts, YEAR)
+        location = mw_eph['earth'] + Topos(latitude_degrees=LATITUDE, longitude_degrees=LONGITUDE)
+        time_stage(results, 'galactic_center_observe', lambda: location.at(grid).observe(
+            GALACTIC_CENTER).apparent().altaz())
+        time_stage(results, 'galactic_center_analytic', lambda: fixed_star_altitudes(
+            GALACTIC_CENTER, grid, LATITUDE, LONGITUDE, mw_eph['earth']))
+
+    print("ดาวหาง")
+    with open(FIXTURE_COMETS, 'rb') as f:
+        fixture = f.read()
+
+    def parse_catalog():
+        with io.BytesIO(fixture) as f:
+            return mpc.load_comets_dataframe(f)
+
+    comets = time_stage(results, 'comet_catalog_parse', parse_catalog)
+    if comets is None:
+        comets = parse_catalog()
+
+    if comet_eph is not None:
+        sun, earth = comet_eph['sun'], comet_eph['earth']
+    else:
+        sun = earth = None
+    months = list(range(COMET_MONTHS[0], COMET_MONTHS[1] + 1))
+
+    def screening():
+        elements = orbital_elements(comets, ts)
+        return screen_magnitudes(elements, sun, earth, ts.utc(YEAR, months, 15))
+
+    mags = time_stage(results, 'comet_screening', screening, requires=comet_needs)
+
+    if mags is not None:
+        first = np.flatnonzero(mags[:, 0] <= comet_search.MAX_MAGNITUDE)
+        candidates = [(comets.iloc[i], float(mags[i, 0]), int(i)) for i in first]
+        topos = Topos(latitude_degrees=comet_search.LATITUDE, longitude_degrees=comet_search.LONGITUDE)
+        time_stage(results, 'comet_detailed_instants', lambda: comet_search.check_instants(
+            candidates, sun, earth + topos, ts, YEAR, months[0]), requires=comet_needs)
+        time_stage(results, 'comet_detailed_nightly', lambda: comet_search.check_nightly(
+            candidates, sun, earth, topos, ts, YEAR, months[0]), requires=comet_needs)
+
+        closest = [row for row, _, _ in candidates[:CLOSEST_APPROACH_COMETS]]
+
+        def closest_daily():
+            return [comet_search.get_closest_approach_in_year(
+                sun + mpc.comet_orbit(row, ts, GM_SUN_Pitjeva_2005_km3_s2), sun, earth, ts, YEAR) for row in closest]
+
+        time_stage(results, 'closest_approach_daily', closest_daily, requires=comet_needs)
+        time_stage(results, 'closest_approach_batched', lambda: closest_approach(
+            orbital_elements(pd.DataFrame(closest), ts), sun, earth, ts, YEAR), requires=comet_needs)
+
+    time_stage(results, 'comet_search', lambda: comet_search.search_comets(
+        comets, sun, earth, ts, YEAR, months[0], months[-1], verbose=False), repeat=1, requires=comet_needs)
+    time_stage(results, 'comet_search_parallel', lambda: comet_search.search_comets(
+        comets, sun, earth, ts, YEAR, months[0], months[-1], verbose=False, workers=None,
+        ephemeris_path=comet_eph.path), repeat=1, requires=comet_needs)
+    # รอบแรกคำนวณทุกดวงแล้วเก็บผล รอบถัดไปเป็นกรณีแคตตาล็อกไม่เปลี่ยน (อ่านผลเดิมทั้งหมด)
+    with tempfile.TemporaryDirectory() as tmp:
+        conn = open_comet_store(os.path.join(tmp, 'comet_results.sqlite'))
+        cached_search = lambda: comet_search.search_comets_cached(
+            conn, comets, sun, earth, ts, YEAR, months[0], months[-1], verbose=False)
+        time_stage(results, 'comet_search_store_fill', cached_search, repeat=1, requires=comet_needs)
+        time_stage(results, 'comet_search_store_reuse', cached_search, requires=comet_needs)
+        conn.close()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        print(f"ICS -> Excel ({ICS_EVENTS} events)")
+        ics_path = os.path.join(tmp, 'benchmark.ics')
+        write_benchmark_ics(ics_path, ICS_EVENTS)
+        time_stage(results, 'ics_to_excel', lambda: ics_to_excel(ics_path, os.path.join(tmp, 'a.xlsx')), repeat=1)
+        time_stage(results, 'ics_to_excel_streaming', lambda: ics_to_excel_streaming(
+            ics_path, os.path.join(tmp, 'b.xlsx')), repeat=1)
+
+        print("วาดกราฟ")
+        df = prepare_frame(benchmark_windows())
+        time_stage(results, 'chart_render', lambda: render_chart(df, os.path.join(tmp, 'chart.png')))
+        time_stage(results, 'chart_batch_by_month', lambda: render_batch(
+            df, 'month', os.path.join(tmp, 'charts'), workers=1), repeat=1)
+
+    return results
+
+def compare(results, baseline_path):
+    # เทียบเวลาที่ดีที่สุดกับผลครั้งก่อน (> 1 = ช้าลง)
+    with open(baseline_path, encoding='utf-8') as f:
+        baseline = {r['stage']: r for r in json.load(f)['stages'] if 'best' in r}
+    print(f"\nเทียบกับ {baseline_path}")
+    for r in results:
+        if 'best' in r and r['stage'] in baseline:
+            ratio = r['best'] / baseline[r['stage']]['best']
+            flag = "  ⚠️ ช้าลง" if ratio > 1.2 else ""
+            print(f"  - {r['stage']:<28} {baseline[r['stage']]['best']:8.3f} -> {r['best']:8.3f} s (x{ratio:.2f}){flag}")
+
+def main():
+    print(f"🚀 Benchmark StarGazing ({datetime.now():%Y-%m-%d %H:%M:%S})")
+    results = run_benchmarks()
+
+    report = {
+        "created": datetime.now().isoformat(timespec='seconds'),
+        "commit": _git_commit(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "numpy": np.__version__,
+        "pandas": pd.__version__,
+        "stages": results,
+    }
+    os.makedirs(RESULTS_DIR, exist_ok=True)
+    path = os.path.join(RESULTS_DIR, f"benchmark_{datetime.now():%Y%m%d-%H%M%S}.json")
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(report, f, indent=4, ensure_ascii=False)
+    print(f"\n💾 บันทึกผลสำเร็จ: {os.path.abspath(path)}")
+
+    if BASELINE_FILE:
+        compare(results, BASELINE_FILE)
+
+if __name__ == "__main__":
+    main()
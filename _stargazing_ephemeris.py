@@ -0,0 +1,81 @@
+from skyfield.api import Loader
+from skyfield.jpllib import SpiceKernel
+from jplephem.excerpter import write_excerpt
+import threading
+import os
+
+# =================ตั้งค่า Ephemeris=================
+# โฟลเดอร์ของไฟล์ ephemeris เต็ม (de421.bsp, de440s.bsp ...) ถ้าไม่มีไฟล์จะดาวน์โหลดให้แบบ load() เดิม
+EPHEMERIS_DIR = os.environ.get('STARGAZING_EPHEMERIS_DIR', '.')
+
+# ตัดไฟล์ ephemeris เหลือเฉพาะช่วงปีที่ใช้ (excerpt) เก็บไว้ใน EXCERPT_DIR
+# de440s ทั้งไฟล์ 32 MB เหลือไม่ถึง 1 MB ต่อปี เปิดเร็ว และ memory-map เฉพาะส่วนที่ใช้
+USE_EXCERPTS = True
+EXCERPT_DIR = os.path.join(EPHEMERIS_DIR, 'excerpts')
+
+# เผื่อเวลาก่อน/หลังช่วงปี (วัน) สำหรับ light-time และการค้นหาที่เลยขอบปีเล็กน้อย
+EXCERPT_MARGIN_DAYS = 40
+# ====================================================
+
+# ไฟล์ที่เปิดแล้วของ process นี้ (เปิดครั้งเดียวใช้ร่วมกันทุกฟังก์ชัน/ทุก thread)
+# jplephem อ่านข้อมูลแต่ละ segment ผ่าน memory-map จึงไม่โหลดทั้งไฟล์เข้า RAM
+_kernels = {}
+_timescale = []
+_lock = threading.RLock()
+
+def timescale():
+    with _lock:
+        if not _timescale:
+            _timescale.append(Loader(EPHEMERIS_DIR).timescale())
+        return _timescale[0]
+
+def _julian_date(year):
+    # Julian date (TDB ~ TT) ของ 1 ม.ค. ปีนั้น เวลา 00:00
+    return timescale().tt(year, 1, 1).tt
+
+def excerpt_path(name, start_year, end_year, margin_days=None, directory=None):
+    margin_days = EXCERPT_MARGIN_DAYS if margin_days is None else margin_days
+    base, ext = os.path.splitext(name)
+    return os.path.join(directory or EXCERPT_DIR, f"{base}-{start_year}-{end_year}-m{margin_days}{ext}")
+
+def write_ephemeris_excerpt(kernel, path, start_year, end_year, margin_days=None):
+    # ตัดทุก segment ของไฟล์เต็มให้เหลือช่วง start_year ถึงสิ้นปี end_year (+/- margin_days)
+    # เขียนไฟล์ชั่วคราวก่อนแล้วค่อย rename กันไฟล์เสียถ้ามีหลาย process สร้างพร้อมกัน
+    margin_days = EXCERPT_MARGIN_DAYS if margin_days is None else margin_days
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    tmp = f"{path}.{os.getpid()}.tmp"
+    start_jd = _julian_date(start_year) - margin_days
+    end_jd = _julian_date(end_year + 1) + margin_days
+    with open(tmp, 'w+b') as f:
+        write_excerpt(kernel.spk, f, start_jd, end_jd, kernel.spk.daf.summaries())
+    os.replace(tmp, path)
+    return path
+
+def ephemeris(name, years=None, use_excerpts=None):
+    # คืน SpiceKernel ของไฟล์ name (เปิดครั้งเดียวต่อ process)
+    # years = ช่วงปีที่จะใช้ (เช่น range(2026, 2030)) และ use_excerpts เปิดอยู่ จะใช้ไฟล์ที่ตัดเหลือเฉพาะช่วงนั้น
+    use_excerpts = USE_EXCERPTS if use_excerpts is None else use_excerpts
+    span = (min(years), max(years)) if years is not None and use_excerpts else None
+    key = (name, span)
+    with _lock:
+        if key in _kernels:
+            return _kernels[key]
+
+        loader = Loader(EPHEMERIS_DIR)
+        if span is None:
+            kernel = loader(name)
+        else:
+            # สร้าง excerpt ใหม่เมื่อยังไม่มี หรือไฟล์ต้นฉบับใหม่กว่า (ถ้ามีแต่ excerpt ก็ใช้ได้โดยไม่ต้องมีไฟล์เต็ม)
+            path = excerpt_path(name, *span)
+            source_path = loader.path_to(name)
+            stale = os.path.exists(path) and os.path.exists(source_path) and \
+                os.path.getmtime(source_path) > os.path.getmtime(path)
+            if stale or not os.path.exists(path):
+                full = _kernels.get((name, None)) or loader(name)
+                write_ephemeris_excerpt(full, path, *span)
+                if (name, None) not in _kernels:
+                    full.close()
+            kernel = SpiceKernel(path)
+            kernel.source_path = source_path
+        _kernels[key] = kernel
+        return kernel
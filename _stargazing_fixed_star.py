@@ -0,0 +1,79 @@
+from skyfield.framelib import true_equator_and_equinox_of_date
+from skyfield.nutationlib import iau2000b_radians
+from skyfield.constants import ASEC2RAD
+import numpy as np
+
+# =================ตั้งค่าวัตถุที่มี RA/Dec คงที่=================
+# มุมสูงของดาวฤกษ์/ใจกลางทางช้างเผือก/วัตถุท้องฟ้าลึก คำนวณจากเวลาดาราคติ (GAST) และ hour angle โดยตรง
+# ไม่ต้อง observe().apparent().altaz() ทุกเวลา
+# 'apparent'   = RA/Dec ปรากฏของวันนั้น (precession + nutation + aberration) จาก Skyfield ทุก APPARENT_STEP_DAYS วัน
+#                แล้ว interpolate ต่างจาก observe().apparent().altaz() ไม่ถึง 0.001 องศา
+# 'precession' = หมุนพิกัด J2000 ด้วย precession + nutation ของแต่ละเวลา ไม่ใช้ ephemeris (ไม่รวม aberration ~20")
+CORRECTION = 'apparent'
+APPARENT_STEP_DAYS = 1.0
+# ====================================================
+
+# อัตราการหมุนของโลกเทียบดาวฤกษ์ (ชั่วโมง sidereal ต่อ 1 วัน)
+SIDEREAL_HOURS_PER_DAY = 24 * 1.00273781191135448
+
+# ระยะของ Star ที่ไม่มี parallax แบบเดียวกับ Skyfield (1 gigaparsec) ใช้เมื่อต้องการเวกเตอร์ตำแหน่ง (AU)
+DISTANT_STAR_AU = 1.0 / np.sin(1.0e-9 * ASEC2RAD)
+
+def _unit_vector(star):
+    ra, dec = star.ra.radians, star.dec.radians
+    return np.array([np.cos(dec) * np.cos(ra), np.cos(dec) * np.sin(ra), np.sin(dec)])
+
+def apparent_xyz(star, t, earth=None, correction=None):
+    # ตำแหน่งของ star จากใจกลางโลก ในกรอบ true equator and equinox of date (AU) ของทุกเวลาใน t
+    # 'apparent' ต้องส่ง earth (เช่น eph['earth']) มาด้วย
+    correction = CORRECTION if correction is None else correction
+    tt = t.tt
+    if correction == 'precession':
+        xyz = np.einsum('ij...,j->i...', t.M, _unit_vector(star))
+        return xyz * DISTANT_STAR_AU
+
+    # RA/Dec ปรากฏเปลี่ยนไม่ถึง 1" ต่อวัน จึงคำนวณเฉพาะจุดห่างกัน APPARENT_STEP_DAYS แล้ว interpolate
+    start = np.floor(np.min(tt))
+    count = int(np.ceil((np.max(tt) - start) / APPARENT_STEP_DAYS)) + 2
+    sample_tt = start + np.arange(count) * APPARENT_STEP_DAYS
+    samples = t.ts.tt_jd(sample_tt)
+    samples._nutation_angles_radians = iau2000b_radians(samples)
+    xyz = earth.at(samples).observe(star).apparent().frame_xyz(true_equator_and_equinox_of_date).au
+    return np.array([np.interp(tt, sample_tt, component) for component in xyz])
+
+def apparent_radec(star, t, earth=None, correction=None):
+    # คืน (RA ชั่วโมง, Dec องศา) ของวันนั้นของทุกเวลาใน t
+    x, y, z = apparent_xyz(star, t, earth, correction)
+    ra = np.degrees(np.arctan2(y, x)) / 15.0 % 24.0
+    dec = np.degrees(np.arctan2(z, np.hypot(x, y)))
+    return ra, dec
+
+def hour_angle_altitude(ra_hours, dec_degrees, gast_hours, latitude, longitude):
+    # sin(alt) = sin(lat) sin(dec) + cos(lat) cos(dec) cos(HA), HA = GAST + ลองจิจูด - RA
+    lat = np.radians(latitude)
+    dec = np.radians(dec_degrees)
+    hour_angle = np.radians((gast_hours + longitude / 15.0 - ra_hours) * 15.0)
+    sin_alt = np.sin(lat) * np.sin(dec) + np.cos(lat) * np.cos(dec) * np.cos(hour_angle)
+    return np.degrees(np.arcsin(np.clip(sin_alt, -1.0, 1.0)))
+
+def fixed_star_altitudes(star, t, latitude, longitude, earth=None, correction=None):
+    # มุมสูง (องศา ไม่รวมการหักเหของแสง) ของ star ณ ทุกเวลาใน t แทน observe().apparent().altaz()
+    ra, dec = apparent_radec(star, t, earth, correction)
+    return hour_angle_altitude(ra, dec, t.gast, latitude, longitude)
+
+def altitude_crossings(ra_hours, dec_degrees, gast_hours, tt, latitude, longitude, altitude):
+    # เวลา (TT) ที่วัตถุขึ้นผ่าน / ตกผ่านมุมสูง altitude ครั้งแรกหลังเวลา tt (ใช้ได้กับ array)
+    # ใช้ RA/Dec ณ เวลา tt ตลอดช่วง (เปลี่ยนไม่ถึง 1" ใน 1 วัน) วันที่อยู่สูงหรือต่ำกว่า altitude ตลอดคืน NaN
+    lat = np.radians(latitude)
+    dec = np.radians(dec_degrees)
+    cos_h0 = (np.sin(np.radians(altitude)) - np.sin(lat) * np.sin(dec)) / (np.cos(lat) * np.cos(dec))
+    h0 = np.where(np.abs(cos_h0) <= 1.0, np.degrees(np.arccos(np.clip(cos_h0, -1.0, 1.0))) / 15.0, np.nan)
+    hour_angle = (gast_hours + longitude / 15.0 - ra_hours) % 24.0
+    rise_tt = tt + ((-h0 - hour_angle) % 24.0) / SIDEREAL_HOURS_PER_DAY
+    set_tt = tt + ((h0 - hour_angle) % 24.0) / SIDEREAL_HOURS_PER_DAY
+    return rise_tt, set_tt
+
+def fixed_star_crossings(star, t, latitude, longitude, altitude, earth=None, correction=None):
+    # เวลาขึ้น/ตกผ่าน altitude ครั้งถัดไปหลังแต่ละเวลาใน t (เช่น 18:00 ของทุกคืน) คืน (rise_tt, set_tt)
+    ra, dec = apparent_radec(star, t, earth, correction)
+    return altitude_crossings(ra, dec, t.gast, t.tt, latitude, longitude, altitude)
@@ -0,0 +1,176 @@
+import atexit
+import contextlib
+import functools
+import json
+import multiprocessing
+import os
+import sys
+import threading
+import time
+import tracemalloc
+from datetime import datetime
+
+# =================ตั้งค่า Profiling=================
+# เปิดด้วย environment variable (ไม่ต้องแก้สคริปต์) เช่น
+#   STARGAZING_PROFILE=1 python3 _milkyway_create_data_set.py
+# จับเวลา (wall time) จำนวนครั้งที่เรียก และหน่วยความจำสูงสุด (tracemalloc) ของแต่ละขั้นตอน
+# แล้วบันทึกเป็น JSON ตอนจบโปรแกรม
+ENABLED = os.environ.get('STARGAZING_PROFILE', '') not in ('', '0', 'false', 'False')
+
+# บันทึกเฉพาะ process หลัก (worker ของ process pool ไม่เปิด profiling และไม่เขียนไฟล์ทับ)
+ENABLED = ENABLED and multiprocessing.parent_process() is None
+
+# ไฟล์ผลลัพธ์ (ค่าเริ่มต้น profile_<ชื่อสคริปต์>.json ในโฟลเดอร์ปัจจุบัน)
+OUTPUT_FILENAME = os.environ.get('STARGAZING_PROFILE_OUTPUT')
+
+# วัดหน่วยความจำสูงสุดรายขั้นตอนด้วย tracemalloc (peak ของ tracemalloc มีค่าเดียวทั้ง process)
+# ใช้ได้เฉพาะโปรแกรมที่ทำขั้นตอนทีละ thread ถ้าหลาย thread ซ้อนกัน (เช่น _stargazing_service.py) peak จะผิด
+# จึงต้องปิดด้วย track_memory(False) หรือ STARGAZING_PROFILE_MEMORY=0
+TRACK_MEMORY = os.environ.get('STARGAZING_PROFILE_MEMORY', '1') not in ('', '0', 'false', 'False')
+
+# บันทึก cProfile ของทั้งโปรแกรมด้วย (ระบุไฟล์ .prof เปิดดูด้วย snakeviz หรือ pstats)
+CPROFILE_FILENAME = os.environ.get('STARGAZING_CPROFILE')
+# ====================================================
+
+_stages = {}
+_lock = threading.Lock()
+_local = threading.local()
+_state = {'started': None, 'wall_start': None, 'profiler': None, 'peak': 0, 'tracemalloc': False}
+
+def enable(output_filename=None, cprofile_filename=None):
+    # เปิด profiling จากโค้ด (ใช้แทน environment variable ได้) เรียกซ้ำได้ไม่มีผล
+    global ENABLED, OUTPUT_FILENAME, CPROFILE_FILENAME
+    OUTPUT_FILENAME = output_filename or OUTPUT_FILENAME
+    CPROFILE_FILENAME = cprofile_filename or CPROFILE_FILENAME
+    ENABLED = True
+    if _state['started'] is not None:
+        return
+
+    _state['started'] = datetime.now()
+    _state['wall_start'] = time.perf_counter()
+    if TRACK_MEMORY and not tracemalloc.is_tracing():
+        tracemalloc.start()
+        _state['tracemalloc'] = True
+    if CPROFILE_FILENAME:
+        import cProfile
+        _state['profiler'] = cProfile.Profile()
+        _state['profiler'].enable()
+    atexit.register(write_summary)
+
+def track_memory(enabled):
+    # เปิด/ปิดการวัด peak รายขั้นตอน (ปิดแล้ว peak_memory_bytes เป็น None เวลาและจำนวนครั้งยังบันทึกตามเดิม)
+    global TRACK_MEMORY
+    TRACK_MEMORY = enabled
+    if not enabled and _state['tracemalloc']:
+        tracemalloc.stop()
+        _state['tracemalloc'] = False
+    elif enabled and _state['started'] is not None and not tracemalloc.is_tracing():
+        tracemalloc.start()
+        _state['tracemalloc'] = True
+
+@contextlib.contextmanager
+def _timed(name):
+    # จับเวลาอย่างเดียว ใช้เมื่อปิด TRACK_MEMORY
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - start
+        with _lock:
+            record = _stages.setdefault(name, {'calls': 0, 'seconds': 0.0, 'max_seconds': 0.0,
+                                               'peak_memory_bytes': None})
+            record['calls'] += 1
+            record['seconds'] += elapsed
+            record['max_seconds'] = max(record['max_seconds'], elapsed)
+
+@contextlib.contextmanager
+def _measure(name):
+    # stack ของขั้นตอนที่ซ้อนกันในแต่ละ thread: ขั้นตอนนอกได้ peak ที่รวมขั้นตอนข้างในด้วย
+    stack = getattr(_local, 'stack', None)
+    if stack is None:
+        stack = _local.stack = []
+    if stack:
+        stack[-1]['peak'] = max(stack[-1]['peak'], tracemalloc.get_traced_memory()[1])
+    current = tracemalloc.get_traced_memory()[0]
+    tracemalloc.reset_peak()
+    frame = {'peak': 0}
+    stack.append(frame)
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - start
+        stack.pop()
+        absolute_peak = max(frame['peak'], tracemalloc.get_traced_memory()[1])
+        peak = absolute_peak - current
+        if stack:
+            stack[-1]['peak'] = max(stack[-1]['peak'], absolute_peak)
+        with _lock:
+            record = _stages.setdefault(name, {'calls': 0, 'seconds': 0.0, 'max_seconds': 0.0,
+                                               'peak_memory_bytes': 0})
+            record['calls'] += 1
+            record['seconds'] += elapsed
+            record['max_seconds'] = max(record['max_seconds'], elapsed)
+            record['peak_memory_bytes'] = max(record['peak_memory_bytes'] or 0, peak)
+            # reset_peak() ทำให้ peak ของ tracemalloc ถูกล้าง จึงเก็บ peak ของทั้งโปรแกรมไว้เอง
+            _state['peak'] = max(_state['peak'], absolute_peak)
+
+_disabled = contextlib.nullcontext()
+
+def stage(name):
+    # ใช้กับ with: `with stage('ephemeris_load'): eph = load(...)` ถ้าไม่ได้เปิด profiling ไม่มีค่าใช้จ่ายเพิ่ม
+    if not ENABLED:
+        return _disabled
+    if _state['started'] is None:
+        enable()
+    if not TRACK_MEMORY or not tracemalloc.is_tracing():
+        return _timed(name)
+    return _measure(name)
+
+def profiled(name=None):
+    # decorator จับเวลาทั้งฟังก์ชัน (ชื่อขั้นตอนเริ่มต้นคือชื่อฟังก์ชัน)
+    def decorator(fn):
+        stage_name = name or fn.__name__
+
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            with stage(stage_name):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorator
+
+def summary():
+    # สรุปผลเป็น dict (ใช้ส่งต่อเข้าระบบ monitoring ได้โดยตรง)
+    try:
+        import resource
+        max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * (1 if sys.platform == 'darwin' else 1024)
+    except ImportError:
+        max_rss = None
+    with _lock:
+        stages = {name: dict(record) for name, record in _stages.items()}
+    return {
+        'script': os.path.basename(sys.argv[0]) if sys.argv and sys.argv[0] else None,
+        'started': _state['started'].isoformat(timespec='seconds') if _state['started'] else None,
+        'wall_seconds': time.perf_counter() - _state['wall_start'] if _state['wall_start'] else None,
+        'peak_traced_memory_bytes': max(_state['peak'], tracemalloc.get_traced_memory()[1])
+                                    if tracemalloc.is_tracing() else None,
+        'max_rss_bytes': max_rss,
+        'stages': stages,
+    }
+
+def write_summary():
+    # เรียกอัตโนมัติตอนจบโปรแกรม (atexit)
+    if _state['profiler'] is not None:
+        _state['profiler'].disable()
+        _state['profiler'].dump_stats(CPROFILE_FILENAME)
+        print(f"cProfile: {os.path.abspath(CPROFILE_FILENAME)}", file=sys.stderr)
+
+    report = summary()
+    script = os.path.splitext(report['script'] or 'python')[0]
+    path = OUTPUT_FILENAME or f"profile_{script}.json"
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(report, f, indent=4, ensure_ascii=False)
+    print(f"Profile: {os.path.abspath(path)}", file=sys.stderr)
+
+if ENABLED:
+    enable()
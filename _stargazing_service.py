@@ -0,0 +1,210 @@
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlsplit, parse_qs
+import asyncio
+import threading
+import json
+import time
+
+from _milkyway_create_data_set import milkyway_windows_year
+from _stargazing_ephemeris import ephemeris, timescale
+from _stargazing_profile import stage
+import _stargazing_profile as profile
+
+# =================ตั้งค่า Service=================
+# เปิด HTTP server ในเครื่อง ตอบคำถามซ้ำๆ โดยไม่ต้องเปิดสคริปต์ใหม่/โหลด ephemeris ใหม่ทุกครั้ง
+# ตัวอย่าง:
+#   http://127.0.0.1:8765/milkyway?lat=14.439&lon=101.3725&year=2026&min_alt=10
+#   http://127.0.0.1:8765/comets?year=2026&start_month=1&end_month=3&max_mag=12&lat=18.5558&lon=98.4822
+HOST = '127.0.0.1'
+PORT = 8765
+
+# จำนวนผลลัพธ์ที่จำไว้ (ใช้น้อยที่สุดจะถูกลบก่อน) และจำนวน thread ของงานเบื้องหลัง
+# การคำนวณ (ephemeris/Timescale/pandas ใช้ร่วมกัน ไม่รับประกันว่าอ่านพร้อมกันหลาย thread ได้) ทำทีละงานผ่าน _compute_lock
+# thread ที่เหลือให้โหลดแคตตาล็อก/ephemeris ได้ระหว่างที่อีกงานคำนวณอยู่
+CACHE_SIZE = 256
+WORKERS = 2
+
+# ปัดพิกัดก่อนใช้เป็น key และคำนวณ (2 ตำแหน่ง ~ 1 กม. ผลแทบไม่ต่างกัน แต่ใช้ cache ร่วมกันได้)
+COORD_DECIMALS = 2
+# ====================================================
+
+# ข้อมูลที่โหลดค้างไว้ตลอดอายุ service
+_resources = {}
+
+# ผลลัพธ์ที่คำนวณแล้ว (LRU) และงานที่กำลังคำนวณอยู่ (คำขอซ้ำระหว่างคำนวณจะรอผลเดียวกัน)
+_results = OrderedDict()
+_in_flight = {}
+_stats = {'hits': 0, 'misses': 0, 'coalesced': 0}
+
+_executor = ThreadPoolExecutor(max_workers=WORKERS)
+_catalog_lock = threading.Lock()
+_compute_lock = threading.Lock()
+
+def load_resources():
+    # ephemeris ทั้งไฟล์ (ตอบได้ทุกปี) เปิดครั้งเดียวผ่าน _stargazing_ephemeris.py
+    # ส่วนดาวหาง (pandas + แคตตาล็อก + de421) โหลดตอนมีคำขอ /comets ครั้งแรก คำขอทางช้างเผือกจึงไม่ต้องรอ
+    print("กำลังโหลด ephemeris...")
+    with stage('ephemeris_load'):
+        _resources['ts'] = timescale()
+        _resources['mw_eph'] = ephemeris('de440s.bsp')
+
+def _comet_module():
+    import _comet_check_by_year_and_month as comet_search
+    return comet_search
+
+def refresh_catalog(force=False):
+    # โหลดแคตตาล็อกใหม่เมื่อค้างไว้นานกว่า CATALOG_MAX_AGE_HOURS (ผลเก่าใน cache จะไม่ถูกใช้เพราะ key เปลี่ยน)
+    # คืน (เวลาที่โหลด, แคตตาล็อก) ที่อ่านพร้อมกันใน lock ใช้คู่นี้ทั้ง key และการคำนวณ
+    comet_search = _comet_module()
+    with _catalog_lock:
+        if 'earth' not in _resources:
+            with stage('ephemeris_load'):
+                comet_eph = ephemeris('de421.bsp')
+                _resources['sun'] = comet_eph['sun']
+                _resources['earth'] = comet_eph['earth']
+        age_hours = (time.time() - _resources.get('catalog_loaded', 0)) / 3600.0
+        if force or age_hours > comet_search.CATALOG_MAX_AGE_HOURS:
+            with stage('catalog_load'):
+                _resources['comets'] = comet_search.load_comet_catalog(
+                    max_age_hours=comet_search.CATALOG_MAX_AGE_HOURS, offline=comet_search.CATALOG_OFFLINE,
+                    local_path=comet_search.CATALOG_LOCAL_FILE)
+            _resources['catalog_loaded'] = time.time()
+        return _resources['catalog_loaded'], _resources['comets']
+
+async def cached_query(key, compute):
+    # คืนผลจาก cache ถ้ามี ถ้ามีคำขอเดียวกันกำลังคำนวณอยู่ให้รอผลนั้น ไม่อย่างนั้นคำนวณใน thread pool
+    if key in _results:
+        _results.move_to_end(key)
+        _stats['hits'] += 1
+        return _results[key]
+
+    if key in _in_flight:
+        _stats['coalesced'] += 1
+        return await asyncio.shield(_in_flight[key])
+
+    _stats['misses'] += 1
+    future = asyncio.get_running_loop().run_in_executor(_executor, compute)
+    _in_flight[key] = future
+    try:
+        # shield: ผู้ขอคนแรกตัดการเชื่อมต่อ งานยังเดินต่อให้คนที่รออยู่
+        result = await asyncio.shield(future)
+    finally:
+        _in_flight.pop(key, None)
+
+    _results[key] = result
+    while len(_results) > CACHE_SIZE:
+        _results.popitem(last=False)
+    return result
+
+def _param(query, name, cast, default=None):
+    values = query.get(name)
+    if not values:
+        if default is None:
+            raise ValueError(f"missing parameter: {name}")
+        return default
+    return cast(values[0])
+
+def _coordinates(query):
+    latitude = round(_param(query, 'lat', float), COORD_DECIMALS)
+    longitude = round(_param(query, 'lon', float), COORD_DECIMALS)
+    if not (-90 <= latitude <= 90 and -180 <= longitude <= 180):
+        raise ValueError("lat/lon out of range")
+    return latitude, longitude
+
+async def milkyway_query(query):
+    latitude, longitude = _coordinates(query)
+    year = _param(query, 'year', int)
+    min_alt = _param(query, 'min_alt', float, 10.0)
+    key = ('milkyway', latitude, longitude, year, min_alt)
+
+    def compute():
+        with _compute_lock, stage('milkyway_query'):
+            return milkyway_windows_year(_resources['mw_eph'], _resources['ts'], latitude, longitude, year, min_alt)
+
+    return await cached_query(key, compute)
+
+async def comets_query(query):
+    comet_search = _comet_module()
+    latitude, longitude = _coordinates(query)
+    year = _param(query, 'year', int)
+    start_month = _param(query, 'start_month', int, 1)
+    end_month = _param(query, 'end_month', int, start_month)
+    max_mag = _param(query, 'max_mag', float, comet_search.MAX_MAGNITUDE)
+    min_alt = _param(query, 'min_alt', float, comet_search.MIN_MW_ALTITUDE)
+    if not 1 <= start_month <= end_month <= 12:
+        raise ValueError("invalid month range")
+
+    # ตรวจพารามิเตอร์ก่อน คำขอที่ผิดจะได้ 400 ทันทีโดยไม่ต้องโหลด de421/ดาวน์โหลดแคตตาล็อก
+    catalog_loaded, comets = await asyncio.get_running_loop().run_in_executor(_executor, refresh_catalog)
+    key = ('comets', catalog_loaded, latitude, longitude, year, start_month, end_month,
+           max_mag, min_alt)
+
+    def compute():
+        with _compute_lock, stage('comets_query'):
+            return comet_search.search_comets(comets, _resources['sun'], _resources['earth'],
+                                              _resources['ts'], year, start_month, end_month, max_mag,
+                                              latitude, longitude, min_alt, verbose=False)
+
+    return await cached_query(key, compute)
+
+async def stats_query(query):
+    stats = {**_stats, 'cached': len(_results), 'in_flight': len(_in_flight)}
+    if profile.ENABLED:
+        # service ทำงานยาว ดูสถิติรายขั้นตอนระหว่างทำงานได้เลยไม่ต้องรอปิด
+        stats['profile'] = profile.summary()['stages']
+    return stats
+
+ROUTES = {
+    '/milkyway': milkyway_query,
+    '/comets': comets_query,
+    '/stats': stats_query,
+}
+
+async def handle_connection(reader, writer):
+    status, body = 200, None
+    try:
+        request_line = (await reader.readline()).decode('latin-1').split()
+        # ข้าม header ทั้งหมด (รองรับแค่ GET)
+        while (await reader.readline()).strip():
+            pass
+
+        if len(request_line) < 2 or request_line[0] != 'GET':
+            status, body = 405, {'error': 'only GET is supported'}
+        else:
+            url = urlsplit(request_line[1])
+            handler = ROUTES.get(url.path)
+            if handler is None:
+                status, body = 404, {'error': f"unknown path {url.path}", 'paths': list(ROUTES)}
+            else:
+                body = await handler(parse_qs(url.query))
+    except ValueError as e:
+        status, body = 400, {'error': str(e)}
+    except Exception as e:
+        status, body = 500, {'error': repr(e)}
+
+    payload = json.dumps(body, ensure_ascii=False).encode('utf-8')
+    reason = {200: 'OK', 400: 'Bad Request', 404: 'Not Found', 405: 'Method Not Allowed'}.get(status, 'Error')
+    writer.write(f"HTTP/1.1 {status} {reason}\r\n"
+                 "Content-Type: application/json; charset=utf-8\r\n"
+                 f"Content-Length: {len(payload)}\r\n"
+                 "Connection: close\r\n\r\n".encode('latin-1') + payload)
+    try:
+        await writer.drain()
+    finally:
+        writer.close()
+
+async def serve(host=HOST, port=PORT):
+    server = await asyncio.start_server(handle_connection, host, port)
+    print(f"พร้อมให้บริการที่ http://{host}:{port} (/milkyway, /comets, /stats)")
+    async with server:
+        await server.serve_forever()
+
+if __name__ == "__main__":
+    # หลายขั้นตอนทำซ้อนกันใน thread pool peak ของ tracemalloc ใช้ไม่ได้ บันทึกเฉพาะเวลา
+    profile.track_memory(False)
+    load_resources()
+    try:
+        asyncio.run(serve())
+    except KeyboardInterrupt:
+        print("\nปิด service")